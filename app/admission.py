@@ -0,0 +1,290 @@
+"""
+Admission control and load shedding.
+
+Every gated endpoint has a concurrency limit and a bounded wait queue. A
+request that finds both full, or waits in the queue longer than
+admission_queue_timeout_s, is rejected straight away with 429 and a
+Retry-After header instead of piling up behind a slow image provider.
+
+The concurrency limit adapts to provider latency (a gradient limiter): the
+provider calls in poster_generator report their latency to `provider_limit`
+(failed and timed-out calls as a penalty), which shrinks while short-term
+latency is well above the long-term average and grows back once it recovers. Each endpoint admits at most
+min(its configured max_concurrency, provider_limit.limit) requests at a time.
+
+A cancelled request (see app/deadline.py) gets its response straight away,
+but keeps its slot until the provider calls it abandoned have returned
+("draining" in the gate stats): they still hold a thread and a connection.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+import math
+import threading
+
+from starlette.responses import JSONResponse
+
+from .config import settings
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit driven by observed provider latency.
+
+    Keeps a short-term and a long-term EWMA of latency. On each sample:
+
+        gradient  = clamp(tolerance * long / short, 0.5, 1.0)
+        new_limit = limit * gradient               (gradient < 1)
+                    limit + sqrt(limit)            (gradient == 1)
+
+    so the limit grows by ~sqrt(limit) while latency is stable and is cut by
+    up to half per sample once short-term latency exceeds `tolerance` times
+    the long-term baseline. The headroom is only added while latency is
+    healthy; otherwise limit * 0.5 + sqrt(limit) would level off at 4 and
+    never shrink a small limit. Thread-safe: samples arrive from worker threads.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        min_limit: float = 1.0,
+        max_limit: float = 64.0,
+        tolerance: float = 2.0,
+        smoothing: float = 0.2,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self._limit = float(initial)
+        self._short: float | None = None
+        self._long: float | None = None
+        self._samples = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return max(int(self.min_limit), int(self._limit))
+
+    @property
+    def latency(self) -> float | None:
+        """Long-term average provider latency in seconds (None before any sample)."""
+        return self._long
+
+    def record(self, latency_s: float) -> None:
+        with self._lock:
+            self._samples += 1
+            if self._short is None:
+                self._short = self._long = latency_s
+                return
+            self._short = 0.8 * self._short + 0.2 * latency_s
+            self._long = 0.98 * self._long + 0.02 * latency_s
+
+            gradient = min(1.0, max(0.5, self.tolerance * self._long / self._short))
+            if gradient < 1.0:
+                new_limit = self._limit * gradient
+            else:
+                new_limit = self._limit + math.sqrt(self._limit)
+            new_limit = (1 - self.smoothing) * self._limit + self.smoothing * new_limit
+            self._limit = min(self.max_limit, max(self.min_limit, new_limit))
+
+    def record_failure(self, elapsed_s: float) -> None:
+        """
+        A failed or timed-out call. Fast failures (e.g. instant 5xx) must not
+        read as good latency, so it counts as at least twice the tolerated
+        latency.
+        """
+        baseline = self._long
+        penalty = 2 * self.tolerance * baseline if baseline is not None else elapsed_s
+        self.record(max(elapsed_s, penalty))
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "short_latency_s": self._short,
+            "long_latency_s": self._long,
+            "samples": self._samples,
+        }
+
+
+class EndpointGate:
+    """
+    Concurrency limit plus bounded wait queue for one endpoint.
+
+    Only touched from the event loop, so the counters need no locking.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout_s: float,
+        adaptive: AdaptiveLimit | None = None,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.draining = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._cond: asyncio.Condition | None = None
+        self._cond_loop = None
+
+    def _condition(self) -> asyncio.Condition:
+        # asyncio primitives belong to one event loop; recreate if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._cond_loop is not loop:
+            self._cond = asyncio.Condition()
+            self._cond_loop = loop
+        return self._cond
+
+    def capacity(self) -> int:
+        if self.adaptive is None:
+            return self.max_concurrency
+        return max(1, min(self.max_concurrency, self.adaptive.limit))
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up, from the provider latency."""
+        latency = self.adaptive.latency if self.adaptive is not None else None
+        if not latency:
+            return settings.admission_retry_after_s
+        estimate = latency * (self.waiting + 1) / self.capacity()
+        return min(60, max(1, math.ceil(estimate)))
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if allowed. False means reject."""
+        if self.waiting == 0 and self.in_flight < self.capacity():
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        self.waiting += 1
+        try:
+            cond = self._condition()
+            async with cond:
+                await asyncio.wait_for(
+                    cond.wait_for(lambda: self.in_flight < self.capacity()),
+                    timeout=self.queue_timeout_s,
+                )
+                self.in_flight += 1
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        finally:
+            self.waiting -= 1
+
+        self.admitted += 1
+        return True
+
+    async def release(self) -> None:
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity(),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "draining": self.draining,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying an EndpointGate to the matching request paths.
+    Gate keys are paths or fnmatch patterns such as "/campaigns/*/regenerate".
+    """
+
+    def __init__(self, app, gates: dict[str, EndpointGate]):
+        self.app = app
+        self.gates = gates
+
+    def _match(self, path: str) -> EndpointGate | None:
+        gate = self.gates.get(path)
+        if gate is not None:
+            return gate
+        for pattern, candidate in self.gates.items():
+            if "*" in pattern and fnmatch.fnmatchcase(path, pattern):
+                return candidate
+        return None
+
+    async def __call__(self, scope, receive, send):
+        gate = self._match(scope["path"]) if scope["type"] == "http" else None
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await gate.acquire():
+            response = JSONResponse(
+                {"detail": f"{gate.name} is overloaded, retry later"},
+                status_code=429,
+                headers={"Retry-After": str(gate.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Set by the endpoint: work it abandoned that is still running
+            pending = [f for f in scope.get("state", {}).get("pending_work", ()) if not f.done()]
+            if pending:
+                gate.draining += 1
+                try:
+                    await asyncio.wait([asyncio.wrap_future(f) for f in pending])
+                finally:
+                    gate.draining -= 1
+            await gate.release()
+
+
+# Shared by all endpoints: they all wait on the same image provider.
+provider_limit = AdaptiveLimit(
+    initial=settings.adaptive_initial_limit,
+    max_limit=max(settings.campaign_max_concurrency, settings.poster_max_concurrency),
+    tolerance=settings.adaptive_latency_tolerance,
+)
+
+
+def build_gates() -> dict[str, EndpointGate]:
+    adaptive = provider_limit if settings.adaptive_concurrency else None
+    return {
+        "/generate_campaign": EndpointGate(
+            "generate_campaign",
+            max_concurrency=settings.campaign_max_concurrency,
+            max_queue=settings.campaign_max_queue,
+            queue_timeout_s=settings.admission_queue_timeout_s,
+            adaptive=adaptive,
+        ),
+        "/generate_poster": EndpointGate(
+            "generate_poster",
+            max_concurrency=settings.poster_max_concurrency,
+            max_queue=settings.poster_max_queue,
+            queue_timeout_s=settings.admission_queue_timeout_s,
+            adaptive=adaptive,
+        ),
+        # Regenerating a variant costs about as much as a single poster
+        "/campaigns/*/regenerate": EndpointGate(
+            "regenerate_variants",
+            max_concurrency=settings.poster_max_concurrency,
+            max_queue=settings.poster_max_queue,
+            queue_timeout_s=settings.admission_queue_timeout_s,
+            adaptive=adaptive,
+        ),
+    }
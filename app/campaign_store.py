@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from .config import settings
+from .streaming import EncodedImage
+
+try:
+    import fcntl
+except ImportError:  # Windows: app.serve needs fork() anyway, one process only
+    fcntl = None
+
+_RECORD = "record.pkl"
+
+
+class _ImageRef:
+    """A stored image in a pickled record: a PNG file in the campaign's directory."""
+
+    def __init__(self, filename: str, mime_type: str):
+        self.filename = filename
+        self.mime_type = mime_type
+
+
+class CampaignStore:
+    """
+    Store of recent campaigns, so single variants can be regenerated without
+    re-running text analysis or the other variants.
+
+    Campaigns live on disk under `root`, one directory per campaign holding
+    the pickled record (analysis, prompts, seeds) and one PNG per image, so
+    every app.serve worker sees the campaigns the others created. The store
+    therefore holds no image buffers in memory: the in-memory originals are
+    freed once their response has been sent, and get() returns images that
+    stream from the stored files.
+
+    Entries expire `ttl_s` after their last use (the record file's mtime),
+    and the least recently used entry is dropped beyond `max_entries`.
+    Record updates take a file lock shared by all processes. Files of an
+    evicted or replaced entry are unlinked; a response still streaming them
+    keeps its open files.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float, root: str | None = None):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.root = root or os.path.join(tempfile.gettempdir(), "poster-campaigns")
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, ".lock"), "a+b") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _dir(self, campaign_id: str) -> str:
+        if not campaign_id.isalnum():
+            raise KeyError(campaign_id)
+        return os.path.join(self.root, campaign_id)
+
+    # ---------- records on disk ----------
+
+    def _store_image(self, directory: str, fields: dict) -> dict:
+        image = fields.get("image_url")
+        if not isinstance(image, EncodedImage):
+            return fields
+        filename = f"{uuid.uuid4().hex}.png"
+        image.save(os.path.join(directory, filename))
+        return {**fields, "image_url": _ImageRef(filename, image.mime_type)}
+
+    def _read(self, campaign_id: str) -> dict | None:
+        try:
+            with open(os.path.join(self._dir(campaign_id), _RECORD), "rb") as f:
+                return pickle.load(f)
+        except (KeyError, FileNotFoundError):
+            return None
+
+    def _write(self, campaign_id: str, stored: dict) -> None:
+        directory = self._dir(campaign_id)
+        tmp = os.path.join(directory, f".{_RECORD}.{uuid.uuid4().hex}")
+        with open(tmp, "wb") as f:
+            pickle.dump(stored, f)
+        os.replace(tmp, os.path.join(directory, _RECORD))
+
+        # Drop PNGs no longer referenced by the record
+        referenced = {
+            v["image_url"].filename for v in stored["variants"] if isinstance(v["image_url"], _ImageRef)
+        }
+        for name in os.listdir(directory):
+            if name.endswith(".png") and name not in referenced:
+                os.unlink(os.path.join(directory, name))
+
+    def _loaded(self, campaign_id: str, stored: dict) -> dict:
+        directory = self._dir(campaign_id)
+        variants = []
+        for v in stored["variants"]:
+            ref = v["image_url"]
+            if isinstance(ref, _ImageRef):
+                image = EncodedImage(
+                    mime_type=ref.mime_type,
+                    file=open(os.path.join(directory, ref.filename), "rb"),
+                )
+                v = {**v, "image_url": image}
+            variants.append(v)
+        return {**stored, "variants": variants}
+
+    def _evict(self) -> None:
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.root):
+            try:
+                last_used = os.stat(os.path.join(self.root, name, _RECORD)).st_mtime
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if now - last_used > self.ttl_s:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            else:
+                entries.append((last_used, name))
+        entries.sort()
+        for _, name in entries[: max(0, len(entries) - self.max_entries)]:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    # ---------- public API ----------
+
+    def add(self, record: dict) -> str:
+        campaign_id = uuid.uuid4().hex
+        self.put(campaign_id, record)
+        return campaign_id
+
+    def put(self, campaign_id: str, record: dict) -> None:
+        directory = self._dir(campaign_id)
+        os.makedirs(directory, exist_ok=True)
+        stored = {**record, "variants": [self._store_image(directory, v) for v in record["variants"]]}
+        with self._locked():
+            self._write(campaign_id, stored)
+            self._evict()
+
+    def get(self, campaign_id: str) -> dict | None:
+        with self._locked():
+            stored = self._read(campaign_id)
+            if stored is None:
+                return None
+            record_path = os.path.join(self._dir(campaign_id), _RECORD)
+            if time.time() - os.stat(record_path).st_mtime > self.ttl_s:
+                shutil.rmtree(self._dir(campaign_id), ignore_errors=True)
+                return None
+            # Refresh the last-use time for expiry and LRU eviction
+            os.utime(record_path)
+            return self._loaded(campaign_id, stored)
+
+    def merge_variants(self, campaign_id: str, fresh: dict[str, dict], fallback: dict) -> dict:
+        """
+        Overwrite the fields of the variants named in `fresh` (variant name ->
+        fields) in the current record, atomically across processes, so
+        concurrent regenerations of different variants of one campaign do not
+        lose each other's updates. `fallback` is used if the record expired
+        meanwhile. Returns the merged record, with the fresh images still in
+        memory.
+        """
+        directory = self._dir(campaign_id)
+        os.makedirs(directory, exist_ok=True)
+        stored_fresh = {name: self._store_image(directory, fields) for name, fields in fresh.items()}
+        with self._locked():
+            stored = self._read(campaign_id)
+            if stored is None:
+                stored = {
+                    **fallback,
+                    "variants": [self._store_image(directory, v) for v in fallback["variants"]],
+                }
+            current = self._loaded(campaign_id, stored)
+            self._write(campaign_id, _merged(stored, stored_fresh))
+            self._evict()
+        return _merged(current, fresh)
+
+    def __len__(self) -> int:
+        if not os.path.isdir(self.root):
+            return 0
+        return sum(
+            os.path.isfile(os.path.join(self.root, name, _RECORD)) for name in os.listdir(self.root)
+        )
+
+
+def _merged(record: dict, fresh: dict[str, dict]) -> dict:
+    variants = [
+        {**v, **fresh[v["variant"]]} if v["variant"] in fresh else v
+        for v in record["variants"]
+    ]
+    return {**record, "variants": variants}
+
+
+campaign_store = CampaignStore(
+    max_entries=settings.campaign_store_max_entries,
+    ttl_s=settings.campaign_store_ttl_s,
+    root=settings.campaign_store_dir,
+)
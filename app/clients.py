@@ -0,0 +1,193 @@
+"""
+Process-wide image provider clients.
+
+Each provider gets one client per process, created on first use and shared by
+all request threads, so requests reuse pooled keep-alive connections (HTTP/2
+when the `h2` package is installed) instead of paying for a new TCP + TLS
+handshake every time. Pool size and keep-alive come from Settings.
+close_clients() is called on app shutdown.
+
+Connection reuse is tracked through httpcore's trace extension: every request
+counts as a request, every TCP connect as a new connection.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import threading
+
+from .config import settings
+
+
+class PoolStats:
+    """Request / new-connection counters for one provider's connection pool."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections_opened += 1
+
+    def request_hook(self, request) -> None:
+        """httpx "request" event hook."""
+        request.extensions["trace"] = self._trace
+        with self._lock:
+            self.requests += 1
+
+    def snapshot(self) -> dict:
+        reused = max(0, self.requests - self.connections_opened)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else None,
+        }
+
+
+_lock = threading.Lock()
+_openai_client = None
+_hf_client = None
+_stats = {"openai": PoolStats(), "huggingface": PoolStats()}
+
+
+def _http2() -> bool:
+    return settings.provider_http2 and importlib.util.find_spec("h2") is not None
+
+
+def _limits(httpx_module):
+    return httpx_module.Limits(
+        max_connections=settings.provider_pool_max_connections,
+        max_keepalive_connections=settings.provider_pool_max_keepalive,
+        keepalive_expiry=settings.provider_keepalive_expiry_s,
+    )
+
+
+def get_openai_client():
+    """Shared OpenAI client; the SDK client is safe to use from several threads."""
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            if not settings.openai_api_key:
+                raise RuntimeError("OPENAI_API_KEY not set, IMAGE_PROVIDER=openai")
+            import httpx
+            import openai
+
+            http_client = openai.DefaultHttpxClient(
+                limits=_limits(httpx),
+                http2=_http2(),
+                event_hooks={"request": [_stats["openai"].request_hook]},
+            )
+            _openai_client = openai.OpenAI(
+                api_key=settings.openai_api_key,
+                http_client=http_client,
+                timeout=settings.provider_timeout_s,
+            )
+        return _openai_client
+
+
+def _configure_hf_session() -> None:
+    """Point huggingface_hub's shared HTTP session at a pool sized from Settings."""
+    import huggingface_hub
+
+    if hasattr(huggingface_hub, "set_client_factory"):
+        # huggingface_hub >= 1.0: one shared httpx-style client for the process
+        from huggingface_hub.utils import _http as hf_http
+
+        httpx_module = getattr(hf_http, "httpx2", None) or getattr(hf_http, "httpx")
+        hooks = [
+            hook
+            for hook in (getattr(hf_http, "hf_request_event_hook", None), _stats["huggingface"].request_hook)
+            if hook is not None
+        ]
+
+        def factory():
+            return httpx_module.Client(
+                event_hooks={"request": hooks},
+                follow_redirects=True,
+                timeout=None,
+                limits=_limits(httpx_module),
+                http2=_http2(),
+            )
+
+        huggingface_hub.set_client_factory(factory)
+
+    elif hasattr(huggingface_hub, "configure_http_backend"):
+        # Older releases use a requests.Session per thread
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        def backend_factory():
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=settings.provider_pool_max_keepalive,
+                pool_maxsize=settings.provider_pool_max_connections,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            return session
+
+        huggingface_hub.configure_http_backend(backend_factory=backend_factory)
+
+
+def get_hf_client(timeout: float | None = None):
+    """
+    Shared InferenceClient using the pooled huggingface_hub session. With a
+    `timeout` shorter than provider_timeout_s, a new lightweight client with
+    that per-call timeout is returned; it uses the same pooled session.
+    """
+    global _hf_client
+    with _lock:
+        if _hf_client is None:
+            if not settings.hf_api_key:
+                raise RuntimeError("HF_API_KEY not set, IMAGE_PROVIDER=huggingface")
+            from huggingface_hub import InferenceClient
+
+            _configure_hf_session()
+            _hf_client = InferenceClient(
+                api_key=settings.hf_api_key,
+                timeout=settings.provider_timeout_s,
+            )
+    if timeout is not None and timeout < settings.provider_timeout_s:
+        from huggingface_hub import InferenceClient
+
+        return InferenceClient(api_key=settings.hf_api_key, timeout=timeout)
+    return _hf_client
+
+
+def _open_connections(client) -> int | None:
+    """Best effort: connections currently held by an httpx client's pool."""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return len(connections) if connections is not None else None
+
+
+def pool_stats() -> dict:
+    stats = {name: s.snapshot() for name, s in _stats.items()}
+    if _openai_client is not None:
+        stats["openai"]["open_connections"] = _open_connections(_openai_client._client)
+    if _hf_client is not None:
+        import huggingface_hub
+
+        if hasattr(huggingface_hub, "get_session"):
+            stats["huggingface"]["open_connections"] = _open_connections(huggingface_hub.get_session())
+    stats["http2"] = _http2()
+    return stats
+
+
+def close_clients() -> None:
+    """Close pooled connections; the next request creates fresh clients."""
+    global _openai_client, _hf_client
+    with _lock:
+        if _openai_client is not None:
+            _openai_client.close()
+            _openai_client = None
+        if _hf_client is not None:
+            import huggingface_hub
+
+            if hasattr(huggingface_hub, "close_session"):
+                huggingface_hub.close_session()
+            _hf_client = None
@@ -0,0 +1,194 @@
+"""
+Local compositing for master-image campaigns.
+
+One high-resolution master key art image is generated by the provider; each
+campaign variant is then produced here by cropping it to the variant's aspect
+ratio around the most detailed region, downscaling (never upscaling) and
+drawing the title and tagline with PIL according to a layout template.
+
+compose_variant() takes and returns plain bytes so it can run in a process
+pool; this module only imports PIL to keep pool workers cheap to start.
+"""
+
+from __future__ import annotations
+
+import io
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageStat
+
+# Layout templates. Boxes are (left, top, width, height) as fractions of the
+# output image; "scrim" darkens that edge so the text stays readable.
+LAYOUTS: Dict[str, Dict] = {
+    # Portrait one-sheet: tagline at the top, big title over the bottom band
+    "poster": {
+        "tagline_box": (0.08, 0.04, 0.84, 0.06),
+        "title_box": (0.06, 0.74, 0.88, 0.16),
+        "scrim": "bottom",
+    },
+    # Landscape thumbnail: title block in the lower-left third
+    "thumbnail": {
+        "title_box": (0.05, 0.58, 0.55, 0.22),
+        "tagline_box": (0.05, 0.82, 0.55, 0.08),
+        "scrim": "left",
+    },
+    # Square social teaser: centred title and tagline near the bottom
+    "square": {
+        "title_box": (0.08, 0.68, 0.84, 0.14),
+        "tagline_box": (0.12, 0.84, 0.76, 0.06),
+        "scrim": "bottom",
+    },
+}
+
+# Bold TrueType fonts to try before falling back to PIL's built-in font
+_FONT_CANDIDATES = [
+    "DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "Arial Bold.ttf",
+    "arialbd.ttf",
+]
+
+# Width of the downscaled edge map used to score crop windows
+_SALIENCY_WIDTH = 64
+
+
+def smart_crop(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """
+    Crop `image` to the aspect ratio of `size` and resize to `size`, or to the
+    crop size if that is smaller: the crop is never upscaled.
+
+    The crop window is the largest one with the target aspect ratio, slid
+    along the free axis to the position with the most edge energy, which
+    keeps the subject in frame instead of always cropping the centre.
+    """
+    target_w, target_h = size
+    src_w, src_h = image.size
+    target_ratio = target_w / target_h
+
+    if src_w / src_h > target_ratio:
+        crop_w, crop_h = round(src_h * target_ratio), src_h
+    else:
+        crop_w, crop_h = src_w, round(src_w / target_ratio)
+
+    scale = _SALIENCY_WIDTH / src_w
+    energy = (
+        image.convert("L")
+        .resize((_SALIENCY_WIDTH, max(1, round(src_h * scale))))
+        .filter(ImageFilter.FIND_EDGES)
+    )
+    win_w = max(1, round(crop_w * scale))
+    win_h = max(1, round(crop_h * scale))
+
+    best_score, best_x, best_y = -1.0, 0, 0
+    for x in range(energy.width - win_w + 1):
+        for y in range(energy.height - win_h + 1):
+            score = ImageStat.Stat(energy.crop((x, y, x + win_w, y + win_h))).sum[0]
+            if score > best_score:
+                best_score, best_x, best_y = score, x, y
+
+    left = min(src_w - crop_w, round(best_x / scale))
+    top = min(src_h - crop_h, round(best_y / scale))
+    cropped = image.crop((left, top, left + crop_w, top + crop_h))
+    if crop_w <= target_w:
+        return cropped
+    return cropped.resize(size, Image.LANCZOS)
+
+
+def _load_font(size: int, font_path: str | None = None) -> ImageFont.ImageFont:
+    for candidate in ([font_path] if font_path else []) + _FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def _wrap(draw: ImageDraw.ImageDraw, text: str, font, max_width: int) -> List[str]:
+    lines: List[str] = []
+    for word in text.split():
+        if lines and draw.textlength(f"{lines[-1]} {word}", font=font) <= max_width:
+            lines[-1] = f"{lines[-1]} {word}"
+        else:
+            lines.append(word)
+    return lines
+
+
+def _fit_text(draw, text: str, box: Tuple[int, int, int, int], max_lines: int, font_path):
+    """Largest font size at which `text` fits `box` in at most `max_lines` lines."""
+    _, _, box_w, box_h = box
+    size = max(8, box_h // max_lines)
+    while True:
+        font = _load_font(size, font_path)
+        lines = _wrap(draw, text, font, box_w)
+        widest = max((draw.textlength(line, font=font) for line in lines), default=0)
+        if size <= 8 or (len(lines) <= max_lines and widest <= box_w and len(lines) * size * 1.15 <= box_h):
+            return font, lines, size
+        size = int(size * 0.9)
+
+
+def _draw_text_block(draw, text: str, box, max_lines: int, font_path, align: str = "center"):
+    if not text:
+        return
+    left, top, box_w, box_h = box
+    font, lines, size = _fit_text(draw, text, box, max_lines, font_path)
+    line_h = size * 1.15
+    y = top + (box_h - line_h * len(lines)) / 2
+    for line in lines:
+        width = draw.textlength(line, font=font)
+        x = left + (box_w - width) / 2 if align == "center" else left
+        draw.text(
+            (x, y),
+            line,
+            font=font,
+            fill=(255, 255, 255, 255),
+            stroke_width=max(1, size // 20),
+            stroke_fill=(0, 0, 0, 255),
+        )
+        y += line_h
+
+
+def _scrim(size: Tuple[int, int], edge: str) -> Image.Image:
+    """Transparent-to-dark gradient over the half of the image at `edge`."""
+    w, h = size
+    length = w if edge == "left" else h
+    gradient = Image.linear_gradient("L").resize((1, length // 2))  # 0 at top -> 255
+    alpha = Image.new("L", size, 0)
+    if edge == "bottom":
+        alpha.paste(gradient.resize((w, length // 2)), (0, h - length // 2))
+    elif edge == "top":
+        alpha.paste(gradient.transpose(Image.FLIP_TOP_BOTTOM).resize((w, length // 2)), (0, 0))
+    else:
+        alpha.paste(gradient.transpose(Image.ROTATE_270).resize((length // 2, h)), (0, 0))
+    alpha = alpha.point(lambda v: int(v * 0.7))
+    overlay = Image.new("RGBA", size, (0, 0, 0, 0))
+    overlay.putalpha(alpha)
+    return overlay
+
+
+def compose_variant(
+    master_png: bytes,
+    size: Tuple[int, int],
+    layout: str,
+    title: str,
+    tagline: str,
+    font_path: str | None = None,
+) -> bytes:
+    """Crop the master image for one variant, add typography, return PNG bytes."""
+    template = LAYOUTS[layout]
+    with Image.open(io.BytesIO(master_png)) as master:
+        image = smart_crop(master.convert("RGB"), size).convert("RGBA")
+
+    image = Image.alpha_composite(image, _scrim(image.size, template["scrim"]))
+    draw = ImageDraw.Draw(image)
+    w, h = image.size
+
+    def px(box):
+        return (int(box[0] * w), int(box[1] * h), int(box[2] * w), int(box[3] * h))
+
+    align = "left" if template["scrim"] == "left" else "center"
+    _draw_text_block(draw, title.upper(), px(template["title_box"]), 2, font_path, align)
+    _draw_text_block(draw, tagline, px(template["tagline_box"]), 1, font_path, align)
+
+    buf = io.BytesIO()
+    image.convert("RGB").save(buf, format="PNG")
+    return buf.getvalue()
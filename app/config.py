@@ -18,6 +18,84 @@ class Settings(BaseSettings):
     # Default to SDXL base 1.0 as requested
     hf_model: str = "stabilityai/stable-diffusion-xl-base-1.0"
 
+    # Shared provider connection pools (see app/clients.py); HTTP/2 is used
+    # when enabled here and the `h2` package is installed
+    provider_pool_max_connections: int = 20
+    provider_pool_max_keepalive: int = 10
+    provider_keepalive_expiry_s: float = 60.0
+    provider_http2: bool = True
+    provider_timeout_s: float = 120.0
+
+    # Per-request deadline in seconds (0 = none); clients may lower it with
+    # the X-Request-Timeout header. Work for requests past their deadline or
+    # whose client disconnected is cancelled (see app/deadline.py).
+    request_timeout_s: float = 300.0
+    disconnect_poll_interval_s: float = 0.25
+
+    # Quality tier for campaign images when neither the request nor the
+    # variant sets one ("draft", "standard" or "final", see app/quality.py)
+    default_quality: str = "standard"
+    # /generate_poster without a tier keeps its original full-resolution output
+    poster_default_quality: str = "final"
+
+    # Default /generate_campaign mode: "per_variant" (one provider call per
+    # variant) or "master" (one key art image, variants composited locally)
+    campaign_mode: str = "per_variant"
+    master_quality: str = "final"
+    master_negative_prompt: str = "text, letters, typography, watermark, logo"
+    # Process pool size for local compositing (0 = number of CPUs)
+    compositor_workers: int = 0
+    # Optional TrueType font for titles; falls back to DejaVu / PIL's default
+    title_font_path: str | None = None
+
+    # Encoded images one request keeps in memory; later images are spilled to
+    # temporary files in image_spool_dir (None = system temp dir). 0 = no limit.
+    image_memory_budget_mb: float = 64.0
+    image_spool_dir: str | None = None
+
+    # Recent campaigns kept for /campaigns/{id}/regenerate (see app/campaign_store.py)
+    campaign_store_max_entries: int = 16
+    campaign_store_ttl_s: float = 3600.0
+    # Directory shared by all app.serve workers (None = <system temp>/poster-campaigns)
+    campaign_store_dir: str | None = None
+
+    # Map model.safetensors into memory instead of copying it, so the weights
+    # are shared between processes (see app/serve.py)
+    classifier_mmap_weights: bool = True
+    # Inference settings for predict_genre; pick them with benchmark_classifier.py.
+    # The model was trained with max_length=128.
+    classifier_max_length: int = 256
+    # torch intra-op threads (0 = torch default)
+    classifier_num_threads: int = 0
+    # Hot-swap the classifier when its files change, checked every N seconds
+    # (0 = off; see reload_classifier() in app/text_analysis.py)
+    classifier_watch_interval_s: float = 0.0
+    # Required in X-Admin-Token by the /admin endpoints; unset disables them
+    admin_token: str | None = Field(default=None, env="ADMIN_TOKEN")
+
+    # Admission control (see app/admission.py): per-endpoint concurrency and
+    # queue limits; requests beyond them get 429 + Retry-After
+    admission_enabled: bool = True
+    campaign_max_concurrency: int = 4
+    campaign_max_queue: int = 8
+    poster_max_concurrency: int = 8
+    poster_max_queue: int = 16
+    admission_queue_timeout_s: float = 30.0
+    admission_retry_after_s: int = 5
+    # Shrink the concurrency limits when provider latency rises
+    adaptive_concurrency: bool = True
+    adaptive_initial_limit: int = 4
+    adaptive_latency_tolerance: float = 2.0
+
+    # Per-request profiling (see app/profiling.py): requests sending
+    # `X-Profile: 1` with the admin token, plus this fraction of all requests,
+    # are profiled. Only the newest profile_max_count profiles are kept (0 = all).
+    profile_sample_rate: float = 0.0
+    profile_dir: str = "profiles"
+    profile_max_count: int = 50
+    profile_interval_ms: float = 5.0
+    profile_top_functions: int = 30
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -0,0 +1,116 @@
+"""
+Request deadlines and cancellation.
+
+A Deadline is created per request from the X-Request-Timeout header (seconds)
+or settings.request_timeout_s, and is cancelled early when the client
+disconnects. The pipeline checks it between stages and variants, and waits
+on provider calls through Deadline.wait(), so a cancelled request stops
+queueing new work and stops waiting for calls already in flight.
+
+Python cannot interrupt a blocking HTTP call, so an abandoned provider call
+keeps its worker thread until the provider answers or its HTTP timeout (the
+remaining deadline) fires; its result is discarded. Abandoned calls are kept
+in Deadline.abandoned, and AdmissionMiddleware holds the request's slot until
+they have returned, so abandoned work still counts against the concurrency
+limit. cancellation_stats counts the work that was skipped.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future, wait
+
+# How often Deadline.wait() re-checks for cancellation
+_POLL_S = 0.1
+
+
+class RequestCancelled(Exception):
+    """The request was cancelled; nobody will read the result."""
+
+
+class DeadlineExceeded(RequestCancelled):
+    pass
+
+
+class ClientDisconnected(RequestCancelled):
+    pass
+
+
+class Deadline:
+    def __init__(self, timeout_s: float | None = None):
+        self.timeout_s = timeout_s if timeout_s and timeout_s > 0 else None
+        self.expires_at = time.monotonic() + self.timeout_s if self.timeout_s else None
+        self._cancelled = threading.Event()
+        # Futures still running after the request gave up on them
+        self.abandoned: list[Future] = []
+
+    def remaining(self) -> float | None:
+        """Seconds left, or None without a time limit."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def cancel(self) -> None:
+        """Mark the request as abandoned by the client."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def is_done(self) -> bool:
+        return self.cancelled or self.remaining() == 0.0
+
+    def error(self) -> RequestCancelled:
+        if self.cancelled:
+            return ClientDisconnected("client disconnected")
+        return DeadlineExceeded(f"request deadline of {self.timeout_s:g}s exceeded")
+
+    def check(self) -> None:
+        if self.is_done():
+            raise self.error()
+
+    def abandon(self, future: Future) -> bool:
+        """Cancel `future` if it has not started; otherwise remember it. True if cancelled."""
+        if future.cancel():
+            return True
+        if not future.done():
+            self.abandoned.append(future)
+        return False
+
+    def wait(self, future: Future):
+        """future.result(), unless the deadline passes or the request is cancelled first."""
+        while True:
+            remaining = self.remaining()
+            timeout = _POLL_S if remaining is None else min(_POLL_S, remaining)
+            done, _ = wait([future], timeout=timeout)
+            if done:
+                return future.result()
+            if self.is_done():
+                self.abandon(future)
+                raise self.error()
+
+
+class CancellationStats:
+    """Counters of cancelled requests and of the work they did not do."""
+
+    def __init__(self):
+        self._counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, n: int = 1) -> None:
+        if n <= 0:
+            return
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def record_cancel(self, error: RequestCancelled) -> None:
+        self.add("client_disconnected" if isinstance(error, ClientDisconnected) else "deadline_exceeded")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+cancellation_stats = CancellationStats()
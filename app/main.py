@@ -1,17 +1,64 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import secrets
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
+from .admission import AdmissionMiddleware, build_gates, provider_limit
+from .config import settings
+from .campaign_store import campaign_store
+from .clients import close_clients, pool_stats
+from .deadline import (
+    ClientDisconnected,
+    Deadline,
+    RequestCancelled,
+    cancellation_stats,
+)
 from .schemas import (
     PosterRequest,
     PosterResponse,
     CampaignResponse,
-    PosterVariant,
+    RegenerateRequest,
+)
+from .poster_generator import (
+    generate_poster,
+    generate_images_for_campaign,
+    generate_master_campaign,
+    shutdown_compositor_pool,
 )
-from .poster_generator import generate_poster, generate_images_for_campaign
-from .text_analysis import analyze_summary
-from .prompt_generator import generate_prompts
+from .text_analysis import (
+    analyze_summary,
+    classifier_status,
+    start_classifier_watcher,
+    start_reload,
+)
+from .prompt_generator import build_master_prompt, build_poster_prompt, generate_prompts
+from .quality import new_seed
+from .profiling import maybe_profile
+from .streaming import json_stream_response, spool_stats
+
 
-app = FastAPI(title="Movie Poster Campaign System", version="0.3.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher = None
+    if settings.classifier_watch_interval_s > 0:
+        watcher = start_classifier_watcher(settings.classifier_watch_interval_s)
+    yield
+    if watcher is not None:
+        watcher.set()
+    # Close pooled provider connections and the compositing processes
+    close_clients()
+    shutdown_compositor_pool()
+
+
+app = FastAPI(title="Movie Poster Campaign System", version="0.3.0", lifespan=lifespan)
+
+# Added first so it runs inside CORSMiddleware: 429s get CORS headers too
+gates = build_gates()
+if settings.admission_enabled:
+    app.add_middleware(AdmissionMiddleware, gates=gates)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,19 +73,141 @@ def health():
     return {"status": "ok"}
 
 
-@app.post("/generate_poster", response_model=PosterResponse)
-def generate(request: PosterRequest):
+@app.get("/metrics")
+def metrics():
+    return {
+        "admission": {name: gate.stats() for name, gate in gates.items()},
+        "provider_limit": provider_limit.stats(),
+        "provider_pools": pool_stats(),
+        "cancellation": cancellation_stats.snapshot(),
+        "classifier": classifier_status(),
+        "image_spool": spool_stats.snapshot(),
+    }
+
+
+# ---------- Admin ----------
+
+
+def _require_admin(token: str | None) -> None:
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if token is None or not secrets.compare_digest(token, settings.admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/admin/classifier")
+def classifier_info(x_admin_token: str | None = Header(default=None)):
+    _require_admin(x_admin_token)
+    return classifier_status()
+
+
+@app.post("/admin/classifier/reload", status_code=202)
+def reload_classifier(force: bool = False, x_admin_token: str | None = Header(default=None)):
     """
-    Backwards-compatible single-poster endpoint.
+    Load the model currently in models/genre_classifier_distilbert in the
+    background, warm it up and swap it in without blocking predictions.
+    Poll GET /admin/classifier for the result. Reaches one worker only; with
+    app.serve use classifier_watch_interval_s instead.
+    """
+    _require_admin(x_admin_token)
+    started = start_reload(force=force)
+    return {"started": started, **classifier_status()}
+
+
+# ---------- Deadlines / cancellation ----------
+
+
+def _request_deadline(x_request_timeout: float | None) -> Deadline:
+    """The server timeout, or the client's X-Request-Timeout if it is shorter."""
+    timeout = settings.request_timeout_s
+    if x_request_timeout is not None and x_request_timeout > 0:
+        timeout = min(timeout, x_request_timeout) if timeout > 0 else x_request_timeout
+    return Deadline(timeout)
+
+
+async def _watch_disconnect(http_request: Request, deadline: Deadline) -> None:
+    while not deadline.is_done():
+        if await http_request.is_disconnected():
+            deadline.cancel()
+            return
+        await asyncio.sleep(settings.disconnect_poll_interval_s)
+
+
+async def _run_pipeline(
+    name: str,
+    http_request: Request,
+    x_profile: str | None,
+    x_admin_token: str | None,
+    x_request_timeout: float | None,
+    pipeline,
+    *args,
+):
+    """
+    Run `pipeline(*args, deadline)` in the threadpool and stream its result.
+
+    The deadline is cancelled as soon as the client disconnects, so the
+    pipeline stops making provider calls nobody will read: 504 when the
+    deadline passes, 499 when the client went away.
     """
+    deadline = _request_deadline(x_request_timeout)
+    # AdmissionMiddleware keeps the slot until abandoned provider calls return
+    http_request.state.pending_work = deadline.abandoned
+    watcher = asyncio.create_task(_watch_disconnect(http_request, deadline))
+
+    def run():
+        with maybe_profile(name, x_profile, x_admin_token) as profiler:
+            result = pipeline(*args, deadline)
+            headers = {"X-Profile-Id": profiler.profile_id} if profiler is not None else None
+            # The profile goes on while the body streams (base64 encoding)
+            return json_stream_response(result, headers=headers, profiler=profiler)
+
     try:
-        return generate_poster(request)
+        return await run_in_threadpool(run)
+    except HTTPException:
+        raise
+    except RequestCancelled as e:
+        cancellation_stats.record_cancel(e)
+        status_code = 499 if isinstance(e, ClientDisconnected) else 504
+        raise HTTPException(status_code=status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        watcher.cancel()
+
+
+@app.post("/generate_poster", response_model=PosterResponse)
+async def generate(
+    request: PosterRequest,
+    http_request: Request,
+    x_profile: str | None = Header(default=None),
+    x_admin_token: str | None = Header(default=None),
+    x_request_timeout: float | None = Header(default=None),
+):
+    """
+    Backwards-compatible single-poster endpoint.
+
+    The body is streamed (see app/streaming.py) rather than validated through
+    PosterResponse; response_model only documents its shape.
+    """
+    return await _run_pipeline(
+        "generate_poster",
+        http_request,
+        x_profile,
+        x_admin_token,
+        x_request_timeout,
+        generate_poster,
+        request,
+    )
 
 
 @app.post("/generate_campaign", response_model=CampaignResponse)
-def generate_campaign(request: PosterRequest):
+async def generate_campaign(
+    request: PosterRequest,
+    http_request: Request,
+    x_profile: str | None = Header(default=None),
+    x_admin_token: str | None = Header(default=None),
+    x_request_timeout: float | None = Header(default=None),
+):
     """
     Full campaign endpoint:
 
@@ -46,36 +215,169 @@ def generate_campaign(request: PosterRequest):
     2) Prompt Generator -> multiple prompt variants
     3) Image Generation -> multiple posters
     4) Return all posters
+
+    With campaign_mode="master", steps 2-3 instead generate one key art image
+    and crop / title it locally for each variant (one provider call).
+
+    Send `X-Profile: 1` with `X-Admin-Token` to profile this request (see
+    app/profiling.py); the profile id is returned in the X-Profile-Id response
+    header.
+
+    The CampaignResponse body is streamed, base64-encoding each image from its
+    PNG buffer as it is sent (see app/streaming.py).
+
+    Remaining variants are skipped once the request deadline passes (504,
+    `X-Request-Timeout` lowers it) or the client disconnects (499).
     """
-    try:
-        # Step 1: Text analysis
-        analysis = analyze_summary(request.summary, request.style_hint)
+    return await _run_pipeline(
+        "generate_campaign",
+        http_request,
+        x_profile,
+        x_admin_token,
+        x_request_timeout,
+        _run_campaign,
+        request,
+    )
+
+
+def _run_campaign(request: PosterRequest, deadline: Deadline | None = None) -> dict:
+    """Run the campaign pipeline; returns the CampaignResponse fields as a dict."""
+    # Step 1: Text analysis
+    analysis = analyze_summary(request.summary, request.style_hint, deadline=deadline)
+
+    # The seed is returned so a draft can be promoted
+    seed = request.seed if request.seed is not None else new_seed()
+    mode = request.campaign_mode or settings.campaign_mode
 
+    if mode == "master":
+        # Steps 2-3: one key art image, variants composited locally
+        master_prompt = build_master_prompt(request.summary, analysis, request.style_hint)
+        images = generate_master_campaign(
+            master_prompt, analysis, quality=request.quality, seed=seed, deadline=deadline
+        )
+    else:
         # Step 2: Prompt generator
-        prompt_dicts = generate_prompts(request.summary, analysis, request.style_hint)
+        prompt_dicts = generate_prompts(
+            request.summary, analysis, request.style_hint, quality=request.quality
+        )
 
         # Step 3: Image generation
-        images = generate_images_for_campaign(prompt_dicts, num_images_per_variant=1)
-
-        variants: list[PosterVariant] = []
-        for idx, img in enumerate(images):
-            variants.append(
-                PosterVariant(
-                    id=idx,
-                    variant=img["variant"],
-                    prompt=img["prompt"],
-                    image_url=img["image_url"],
-                )
-            )
-
-        return CampaignResponse(
-            title=analysis.title,
-            tagline=analysis.tagline,
-            genre=analysis.genre,
-            mood=analysis.mood,
-            color_palette=analysis.color_palette,
-            visual_style_keywords=analysis.visual_style_keywords,
-            variants=variants,
+        images = generate_images_for_campaign(
+            prompt_dicts, num_images_per_variant=1, seed=seed, deadline=deadline
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+    variants = [
+        {
+            "id": idx,
+            "variant": img["variant"],
+            "prompt": img["prompt"],
+            "image_url": img["image_url"],
+            "quality": img["quality"],
+            "seed": img["seed"],
+        }
+        for idx, img in enumerate(images)
+    ]
+
+    # Keep everything needed to regenerate single variants later
+    record = {
+        "summary": request.summary,
+        "style_hint": request.style_hint,
+        "mode": mode,
+        "analysis": analysis,
+        # None when the provider takes no seed (OpenAI): it could not be reused
+        "seed": seed if any(v["seed"] is not None for v in variants) else None,
+        "variants": variants,
+    }
+    campaign_id = campaign_store.add(record)
+    return _campaign_body(campaign_id, record)
+
+
+def _campaign_body(campaign_id: str, record: dict) -> dict:
+    analysis = record["analysis"]
+    return {
+        "campaign_id": campaign_id,
+        "title": analysis.title,
+        "tagline": analysis.tagline,
+        "genre": analysis.genre,
+        "mood": analysis.mood,
+        "color_palette": analysis.color_palette,
+        "visual_style_keywords": analysis.visual_style_keywords,
+        "model_version": analysis.model_version,
+        "seed": record["seed"],
+        "variants": record["variants"],
+    }
+
+
+@app.post("/campaigns/{campaign_id}/regenerate", response_model=CampaignResponse)
+async def regenerate_variants(
+    campaign_id: str,
+    request: RegenerateRequest,
+    http_request: Request,
+    x_profile: str | None = Header(default=None),
+    x_admin_token: str | None = Header(default=None),
+    x_request_timeout: float | None = Header(default=None),
+):
+    """
+    Regenerate only the chosen variants of a campaign returned by
+    /generate_campaign, reusing its stored analysis, prompts and the other
+    variants' images. Costs one provider call per regenerated variant (one in
+    total for master-mode campaigns). Returns the updated full campaign.
+    """
+    return await _run_pipeline(
+        "regenerate_variants",
+        http_request,
+        x_profile,
+        x_admin_token,
+        x_request_timeout,
+        _regenerate,
+        campaign_id,
+        request,
+    )
+
+
+def _regenerate(
+    campaign_id: str, request: RegenerateRequest, deadline: Deadline | None = None
+) -> dict:
+    record = campaign_store.get(campaign_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Campaign {campaign_id} not found or expired")
+
+    unknown = set(request.variants) - {v["variant"] for v in record["variants"]}
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown variants: {sorted(unknown)}")
+
+    analysis = record["analysis"]
+    seed = request.seed if request.seed is not None else new_seed()
+    style_hint = request.style_hint or record["style_hint"]
+    chosen = [v for v in record["variants"] if v["variant"] in request.variants]
+
+    if record["mode"] == "master":
+        master_prompt = build_master_prompt(record["summary"], analysis, style_hint)
+        images = generate_master_campaign(
+            master_prompt,
+            analysis,
+            quality=request.quality or chosen[0]["quality"],
+            seed=seed,
+            variants=request.variants,
+            deadline=deadline,
+        )
+    else:
+        prompt_dicts = [
+            {
+                "variant": v["variant"],
+                "prompt": build_poster_prompt(record["summary"], analysis, v["variant"], style_hint),
+                "quality": request.quality or v["quality"],
+            }
+            for v in chosen
+        ]
+        images = generate_images_for_campaign(
+            prompt_dicts, num_images_per_variant=1, seed=seed, deadline=deadline
+        )
+
+    fresh = {
+        img["variant"]: {k: img[k] for k in ("prompt", "image_url", "quality", "seed")}
+        for img in images
+    }
+    # Merged into the record as it is now: another regenerate may have finished meanwhile
+    record = campaign_store.merge_variants(campaign_id, fresh, fallback=record)
+    return _campaign_body(campaign_id, record)
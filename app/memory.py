@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from typing import Dict
+
+
+def process_memory(pid: int | str = "self") -> Dict[str, int] | None:
+    """
+    Memory breakdown for a process, in bytes, from /proc/<pid>/smaps_rollup.
+
+    - rss:    resident set size
+    - pss:    proportional set size (shared pages split between sharers)
+    - shared: pages also mapped by another process (e.g. copy-on-write
+              weights inherited from the app.serve parent)
+    - unique: pages only this process maps (what each extra worker costs)
+
+    Returns None where smaps_rollup is unavailable (non-Linux, old kernels).
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as f:
+            return parse_smaps_rollup(f.read())
+    except OSError:
+        return None
+
+
+def parse_smaps_rollup(text: str) -> Dict[str, int]:
+    """The process_memory() breakdown from the text of an smaps_rollup file."""
+    fields: Dict[str, int] = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and parts[0].endswith(":") and parts[2] == "kB":
+            fields[parts[0][:-1]] = int(parts[1]) * 1024
+
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "unique": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
@@ -1,12 +1,28 @@
+from __future__ import annotations
+
 import base64
-from typing import Literal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Literal
 import io
+import multiprocessing
+import threading
+import time
 
-from openai import OpenAI
-from huggingface_hub import InferenceClient
-
+from .admission import provider_limit
+from .clients import get_hf_client, get_openai_client
 from .config import settings
-from .schemas import PosterRequest, PosterResponse
+from .deadline import Deadline, RequestCancelled, cancellation_stats
+from .profiling import profiled
+from .prompt_generator import VARIANTS
+from .quality import QUALITY_TIERS, QualityTier, new_seed, resolve_tier
+from .schemas import PosterAnalysis, PosterRequest
+from .streaming import EncodedImage, ImageBudget
+
+# Provider SDKs are imported on first use of that provider, PIL only when
+# compositing, so importing app.main does not pay for SDKs it never uses.
+if TYPE_CHECKING:
+    from huggingface_hub import InferenceClient
+    from openai import OpenAI
 
 
 def build_poster_prompt(request: PosterRequest) -> str:
@@ -20,59 +36,175 @@ def build_poster_prompt(request: PosterRequest) -> str:
     return base.format(summary=request.summary)
 
 
-# ---------- OpenAI ----------
+def _image_budget() -> ImageBudget:
+    """A fresh per-request budget for the images a campaign keeps in memory."""
+    return ImageBudget(
+        max_bytes=int(settings.image_memory_budget_mb * 1024 * 1024),
+        spool_dir=settings.image_spool_dir,
+    )
+
+
+# ---------- Cancellable provider calls ----------
+
+# Provider calls run here so a cancelled request can stop waiting for them
+_provider_executor = ThreadPoolExecutor(
+    max_workers=settings.provider_pool_max_connections,
+    thread_name_prefix="provider",
+)
+
 
+def _call_provider(deadline: Deadline | None, fn, *args, **kwargs):
+    """Run a blocking provider call, giving up as soon as `deadline` is done."""
+    if deadline is None:
+        return fn(*args, **kwargs)
+    deadline.check()
+    future = _provider_executor.submit(profiled(fn), *args, **kwargs)
+    try:
+        return deadline.wait(future)
+    except RequestCancelled:
+        # Cancelled while still queued, or left running in deadline.abandoned
+        cancellation_stats.add("provider_calls_skipped" if future.cancelled() else "provider_calls_abandoned")
+        raise
 
-def _generate_with_openai(prompt: str) -> PosterResponse:
-    if not settings.openai_api_key:
-        raise RuntimeError("OPENAI_API_KEY not set, IMAGE_PROVIDER=openai")
 
-    client = OpenAI(api_key=settings.openai_api_key)
+def _timed(fn, *args, **kwargs):
+    """Call `fn` and report its latency to the adaptive limit, failures included."""
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception:
+        provider_limit.record_failure(time.perf_counter() - start)
+        raise
+    provider_limit.record(time.perf_counter() - start)
+    return result
 
-    result = client.images.generate(
+
+def _call_timeout(deadline: Deadline | None) -> float | None:
+    """
+    HTTP timeout for a provider call: settings.provider_timeout_s, shortened to
+    the time left so the call ends with the request.
+    """
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is None:
+        return None
+    return min(max(1.0, remaining), settings.provider_timeout_s)
+
+
+# ---------- OpenAI ----------
+
+
+def _openai_image(
+    client: OpenAI,
+    prompt: str,
+    tier: QualityTier,
+    deadline: Deadline | None = None,
+) -> str:
+    """Generate one image with OpenAI and return its URL (the API takes no seed)."""
+    timeout = _call_timeout(deadline)
+    options = {"timeout": timeout} if timeout is not None else {}
+
+    result = _call_provider(
+        deadline,
+        _timed,
+        client.images.generate,
         model=settings.image_model,
         prompt=prompt,
         size=settings.image_size,
+        quality=tier.openai_quality,
         n=1,
+        **options,
     )
-    url = result.data[0].url
+    return result.data[0].url
 
-    return PosterResponse(image_url=url, prompt=prompt)
 
+def _generate_with_openai(
+    prompt: str, tier: QualityTier, deadline: Deadline | None = None
+) -> dict:
+    client = get_openai_client()
+    url = _openai_image(client, prompt, tier, deadline)
 
-# ---------- Hugging Face (HF Inference API, via InferenceClient) ----------
+    # No seed: the OpenAI images API cannot reproduce a generation
+    return {"image_url": url, "prompt": prompt, "quality": tier.name, "seed": None}
 
 
-def _hf_client() -> InferenceClient:
-
-    if not settings.hf_api_key:
-        raise RuntimeError("HF_API_KEY not set, IMAGE_PROVIDER=huggingface")
+# ---------- Hugging Face (HF Inference API, via InferenceClient) ----------
 
-    return InferenceClient(api_key=settings.hf_api_key)
 
+def _hf_client(timeout: float | None = None) -> InferenceClient:
+    # Pooled keep-alive session shared by all clients (see app/clients.py)
+    return get_hf_client(timeout=timeout)
 
-def _generate_with_hf(prompt: str) -> PosterResponse:
-    client = _hf_client()
 
-    image = client.text_to_image(
+def _hf_text_to_image(
+    client: InferenceClient,
+    prompt: str,
+    tier: QualityTier,
+    seed: int,
+    negative_prompt: str | None = None,
+):
+    """Generate one image with the HF Inference API and return the PIL image."""
+    return _timed(
+        client.text_to_image,
         prompt=prompt,
+        negative_prompt=negative_prompt,
         model=settings.hf_model,
+        width=tier.width,
+        height=tier.height,
+        num_inference_steps=tier.num_inference_steps,
+        guidance_scale=tier.guidance_scale,
+        seed=seed,
     )
 
-    # Encode image to base64 data URL (PNG)
-    buf = io.BytesIO()
-    image.save(buf, format="PNG")
-    b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    data_url = f"data:image/png;base64,{b64}"
 
-    return PosterResponse(image_url=data_url, prompt=prompt)
+def _hf_image(
+    client: InferenceClient,
+    prompt: str,
+    tier: QualityTier,
+    seed: int,
+    deadline: Deadline | None = None,
+) -> EncodedImage:
+    """
+    Generate one image with the HF Inference API and return it PNG-encoded.
+    Base64 / data-URL encoding happens later, while the response streams.
+    """
+    timeout = _call_timeout(deadline)
+    if timeout is not None:
+        client = _hf_client(timeout)
+    image = _call_provider(deadline, _hf_text_to_image, client, prompt, tier, seed)
+    if deadline is not None and deadline.is_done():
+        image.close()
+        cancellation_stats.add("encodes_skipped")
+        raise deadline.error()
+    encoded = EncodedImage.from_pil(image)
+    # Free the decoded pixels now rather than when the request finishes
+    image.close()
+    return encoded
+
+
+def _generate_with_hf(
+    prompt: str, tier: QualityTier, seed: int, deadline: Deadline | None = None
+) -> dict:
+    client = _hf_client()
+    image = _hf_image(client, prompt, tier, seed, deadline)
+
+    return {"image_url": image, "prompt": prompt, "quality": tier.name, "seed": seed}
 
 
 # ---------- Public entry ----------
 
 
-def generate_poster(request: PosterRequest) -> PosterResponse:
+def generate_poster(request: PosterRequest, deadline: Deadline | None = None) -> dict:
+    """
+    Generate a single poster. Returns the PosterResponse fields as a dict whose
+    "image_url" is a remote URL (OpenAI) or an EncodedImage (Hugging Face),
+    ready for streaming.json_stream_response.
+
+    Raises RequestCancelled once `deadline` passes or is cancelled.
+    """
     prompt = build_poster_prompt(request)
+    # Without a tier, keep the full-resolution output this endpoint always had
+    tier = resolve_tier(request.quality, default=settings.poster_default_quality)
+    seed = request.seed if request.seed is not None else new_seed()
 
     provider: Literal["openai", "huggingface"] = (
         "huggingface"
@@ -81,20 +213,37 @@ def generate_poster(request: PosterRequest) -> PosterResponse:
     )
 
     if provider == "openai":
-        return _generate_with_openai(prompt)
+        return _generate_with_openai(prompt, tier, deadline)
     else:
-        return _generate_with_hf(prompt)
+        return _generate_with_hf(prompt, tier, seed, deadline)
 
 
 def generate_images_for_campaign(
     prompts: list[dict],
-    num_images_per_variant: int = 1
+    num_images_per_variant: int = 1,
+    seed: int | None = None,
+    deadline: Deadline | None = None,
 ) -> list[dict]:
     """
     Generate images for each prompt in a campaign.
-    Returns a flat list of {"variant", "prompt", "image_url"}.
+    Returns a flat list of {"variant", "prompt", "image_url", "quality", "seed"},
+    where "image_url" is a remote URL or an EncodedImage (see generate_poster)
+    and "seed" is None for OpenAI, which takes no seed.
+
+    Every variant's first image uses `seed`, so re-running the campaign with
+    the same seed at a higher quality tier reproduces the same compositions.
+    Extra images per variant use seed + 1, seed + 2, ...
+
+    Once `deadline` passes or is cancelled, the remaining images are skipped
+    and RequestCancelled is raised. Encoded images beyond the request's memory
+    budget (settings.image_memory_budget_mb) are spilled to temporary files.
     """
+    if seed is None:
+        seed = new_seed()
+
     images: list[dict] = []
+    total = len(prompts) * num_images_per_variant
+    budget = _image_budget()
 
     provider: Literal["openai", "huggingface"] = (
         "huggingface"
@@ -105,41 +254,198 @@ def generate_images_for_campaign(
     openai_client = None
     hf_client = None
     if provider == "openai":
-        if not settings.openai_api_key:
-            raise RuntimeError("OPENAI_API_KEY not set, IMAGE_PROVIDER=openai")
-        openai_client = OpenAI(api_key=settings.openai_api_key)
+        openai_client = get_openai_client()
     else:
         hf_client = _hf_client()
 
     for item in prompts:
         variant = item["variant"]
         prompt = item["prompt"]
-
-        for _ in range(num_images_per_variant):
-            if provider == "openai":
-                result = openai_client.images.generate(
-                    model=settings.image_model,
-                    prompt=prompt,
-                    size=settings.image_size,
-                    n=1,
-                )
-                image_url = result.data[0].url
-            else:
-                image = hf_client.text_to_image(
-                    prompt=prompt,
-                    model=settings.hf_model,
-                )
-                buf = io.BytesIO()
-                image.save(buf, format="PNG")
-                b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-                image_url = f"data:image/png;base64,{b64}"
+        tier = resolve_tier(item.get("quality"), default=settings.default_quality)
+
+        for n in range(num_images_per_variant):
+            image_seed = seed + n
+            if deadline is not None and deadline.is_done():
+                cancellation_stats.add("provider_calls_skipped", total - len(images))
+                raise deadline.error()
+
+            try:
+                if provider == "openai":
+                    image_url = _openai_image(openai_client, prompt, tier, deadline)
+                else:
+                    image_url = budget.hold(_hf_image(hf_client, prompt, tier, image_seed, deadline))
+            except RequestCancelled:
+                # Cancelled during this call: the images after it never start
+                cancellation_stats.add("provider_calls_skipped", total - len(images) - 1)
+                raise
 
             images.append(
                 {
                     "variant": variant,
                     "prompt": prompt,
                     "image_url": image_url,
+                    "quality": tier.name,
+                    "seed": image_seed if provider == "huggingface" else None,
                 }
             )
 
-    return images
\ No newline at end of file
+    return images
+
+
+# ---------- Master-image campaigns ----------
+
+_compositor_pool: ProcessPoolExecutor | None = None
+_compositor_pool_lock = threading.Lock()
+
+
+def _get_compositor_pool() -> ProcessPoolExecutor:
+    """
+    Process pool for compose_variant. Uses spawn so the workers do not inherit
+    the parent's torch threads or classifier weights.
+    """
+    global _compositor_pool
+    with _compositor_pool_lock:
+        if _compositor_pool is None:
+            _compositor_pool = ProcessPoolExecutor(
+                max_workers=settings.compositor_workers or None,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _compositor_pool
+
+
+def shutdown_compositor_pool() -> None:
+    global _compositor_pool
+    with _compositor_pool_lock:
+        if _compositor_pool is not None:
+            _compositor_pool.shutdown(wait=True, cancel_futures=True)
+            _compositor_pool = None
+
+
+def _master_tier(tier: QualityTier, specs: list[dict]) -> QualityTier:
+    """
+    `tier` resized so every variant's crop is covered at native resolution.
+
+    A master as wide as the widest variant and as tall as the tallest one
+    contains each variant's aspect-ratio crop at full size. Lower tiers scale
+    it down by their resolution relative to "final"; compose_variant() then
+    outputs the crop size instead of upscaling.
+    """
+    scale = tier.width / QUALITY_TIERS["final"].width
+    width = max(spec["size"][0] for spec in specs) * scale
+    height = max(spec["size"][1] for spec in specs) * scale
+    # SDXL wants multiples of 8
+    return tier.model_copy(
+        update={"width": max(8, round(width / 8) * 8), "height": max(8, round(height / 8) * 8)}
+    )
+
+
+def _generate_master_png(
+    prompt: str, tier: QualityTier, seed: int, deadline: Deadline | None = None
+) -> bytes:
+    """One provider call for the campaign's key art, returned as PNG bytes."""
+    provider: Literal["openai", "huggingface"] = (
+        "huggingface"
+        if settings.image_provider.lower() == "huggingface"
+        else "openai"
+    )
+
+    timeout = _call_timeout(deadline)
+    if provider == "openai":
+        client = get_openai_client()
+        options = {"timeout": timeout} if timeout is not None else {}
+        result = _call_provider(
+            deadline,
+            _timed,
+            client.images.generate,
+            model=settings.image_model,
+            prompt=prompt,
+            size=settings.image_size,
+            quality=tier.openai_quality,
+            n=1,
+            **options,
+        )
+        data = result.data[0]
+        if data.b64_json:
+            return base64.b64decode(data.b64_json)
+        import requests
+
+        resp = _call_provider(
+            deadline, requests.get, data.url, timeout=min(60.0, timeout or 60.0)
+        )
+        resp.raise_for_status()
+        return resp.content
+
+    image = _call_provider(
+        deadline,
+        _hf_text_to_image,
+        _hf_client(timeout),
+        prompt,
+        tier,
+        seed,
+        negative_prompt=settings.master_negative_prompt,
+    )
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def generate_master_campaign(
+    master_prompt: str,
+    analysis: PosterAnalysis,
+    quality: str | None = None,
+    seed: int | None = None,
+    variants: list[str] | None = None,
+    deadline: Deadline | None = None,
+) -> list[dict]:
+    """
+    Generate one key art image and derive every campaign variant from it
+    (or only the variants named in `variants`).
+
+    The master is sized to cover the largest variant crop (see _master_tier).
+    Each variant in VARIANTS is smart-cropped to its own size and gets the
+    analysis title and tagline drawn by compose_variant(), in a process pool.
+    Returns the same {"variant", "prompt", "image_url", "quality", "seed"}
+    list as generate_images_for_campaign, with one provider call in total.
+    Compositions not yet started when `deadline` is done are cancelled.
+    """
+    if seed is None:
+        seed = new_seed()
+    tier = resolve_tier(quality, default=settings.master_quality)
+
+    from .compositor import compose_variant
+
+    specs = [spec for spec in VARIANTS if variants is None or spec["variant"] in variants]
+    master_png = _generate_master_png(master_prompt, _master_tier(tier, specs), seed, deadline)
+
+    pool = _get_compositor_pool()
+    futures = [
+        pool.submit(
+            compose_variant,
+            master_png,
+            spec["size"],
+            spec["layout"],
+            analysis.title,
+            analysis.tagline,
+            settings.title_font_path,
+        )
+        for spec in specs
+    ]
+
+    budget = _image_budget()
+    results: list[dict] = []
+    try:
+        for spec, future in zip(specs, futures):
+            png = deadline.wait(future) if deadline is not None else future.result()
+            results.append(
+                {
+                    "variant": spec["variant"],
+                    "prompt": master_prompt,
+                    "image_url": budget.hold(EncodedImage(png)),
+                    "quality": tier.name,
+                    "seed": seed if settings.image_provider.lower() == "huggingface" else None,
+                }
+            )
+    except RequestCancelled:
+        cancellation_stats.add("compositions_skipped", sum(deadline.abandon(f) for f in futures))
+        raise
+    return results
@@ -0,0 +1,242 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it sends `X-Profile: 1` together with a valid
+`X-Admin-Token` (the header is ignored while ADMIN_TOKEN is unset), or is
+picked by settings.profile_sample_rate. The profile covers, each under its own root
+frame in the collapsed stacks:
+
+- request   the endpoint's thread: analyze_summary -> generate_prompts ->
+            waiting on image generation
+- provider  provider calls and image decoding / PNG encoding, which run in
+            the provider executor (see profiled())
+- stream    the response body, where images are base64-encoded as they
+            are sent (see RequestProfiler.stream())
+
+Master-mode compositing runs in a process pool and is not covered. Two files
+are written to settings.profile_dir once the body has been sent:
+
+- <id>.collapsed  sampled call stacks in collapsed format, one
+                  "root;caller;callee count" line per stack; feed it to
+                  flamegraph.pl or open it in speedscope
+- <id>.txt        cProfile summary of the top functions by cumulative
+                  and by own time, across all of the threads above
+
+Only the newest settings.profile_max_count profiles are kept there.
+
+When profiling is off, maybe_profile() returns a no-op context manager.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Iterator
+
+from .config import settings
+
+_TRUTHY = {"1", "true", "yes", "on"}
+
+# The profiler of the request running in this context, for profiled()
+_current: contextvars.ContextVar["RequestProfiler | None"] = contextvars.ContextVar(
+    "request_profiler", default=None
+)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestProfiler:
+    """
+    Runs cProfile plus a stack sampler on the calling thread and on every
+    thread attach()ed to it. The files are written on exit, or after the
+    response body when stream() was used.
+    """
+
+    def __init__(self, name: str, out_dir: str, interval_s: float):
+        self.name = name
+        self.out_dir = out_dir
+        self.interval_s = interval_s
+        self.profile_id = f"{time.strftime('%Y%m%d_%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}"
+        self.stacks: Counter = Counter()
+        self._profiles: list[cProfile.Profile] = []
+        # Thread id -> root label of the threads being profiled right now
+        self._threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._streaming = False
+        self._closed = False
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            with self._lock:
+                threads = dict(self._threads)
+            frames = sys._current_frames()
+            for thread_id, root in threads.items():
+                frame = frames.get(thread_id)
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if labels:
+                    self.stacks[";".join([root, *reversed(labels)])] += 1
+
+    @contextlib.contextmanager
+    def attach(self, root: str):
+        """Profile the current thread for the duration of the block."""
+        profile = cProfile.Profile()
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._threads[thread_id] = root
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._threads.pop(thread_id, None)
+                self._profiles.append(profile)
+
+    def stream(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """
+        Keep profiling while `chunks` (the response body) is consumed, and
+        write the files once it is exhausted instead of on exit.
+        """
+        self._streaming = True
+
+        def body():
+            try:
+                while True:
+                    with self.attach("stream"):
+                        chunk = next(chunks, None)
+                    if chunk is None:
+                        return
+                    yield chunk
+            finally:
+                self.close()
+
+        return body()
+
+    def __enter__(self) -> "RequestProfiler":
+        self._sampler.start()
+        self._request = self.attach("request")
+        self._request.__enter__()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        _current.reset(self._token)
+        self._request.__exit__(*exc)
+        if not self._streaming or exc[0] is not None:
+            self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        self._sampler.join()
+        self._write()
+
+    def _write(self) -> None:
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, self.profile_id)
+
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        out = io.StringIO()
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(*profiles, stream=out)
+        out.write(f"Profile {self.profile_id}\n\n== Top functions by cumulative time ==\n")
+        stats.sort_stats("cumulative").print_stats(settings.profile_top_functions)
+        out.write("\n== Top functions by own time ==\n")
+        stats.sort_stats("tottime").print_stats(settings.profile_top_functions)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+
+        _prune(self.out_dir, settings.profile_max_count)
+
+
+def _prune(out_dir: str, max_count: int) -> None:
+    """Delete all but the newest `max_count` profiles in `out_dir` (0 = keep all)."""
+    if max_count <= 0:
+        return
+    profiles: dict[str, float] = {}
+    for entry in os.scandir(out_dir):
+        profile_id, ext = os.path.splitext(entry.name)
+        if ext not in (".collapsed", ".txt"):
+            continue
+        try:
+            mtime = entry.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        profiles[profile_id] = max(mtime, profiles.get(profile_id, 0.0))
+    oldest = sorted(profiles, key=profiles.get)[: max(0, len(profiles) - max_count)]
+    for profile_id in oldest:
+        for ext in (".collapsed", ".txt"):
+            # Another worker may be pruning the same directory
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(os.path.join(out_dir, profile_id + ext))
+
+
+def profiled(fn, root: str = "provider"):
+    """
+    `fn`, wrapped to be part of the current request's profile when it runs
+    in another thread (e.g. an executor); `fn` itself when not profiling.
+    """
+    profiler = _current.get()
+    if profiler is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with profiler.attach(root):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+def should_profile(header_value: str | None, admin_token: str | None = None) -> bool:
+    """
+    Whether to profile a request: `X-Profile` counts only with the admin
+    token, so anonymous clients cannot make the server profile (costly in
+    CPU and disk) at will.
+    """
+    if (
+        header_value is not None
+        and header_value.strip().lower() in _TRUTHY
+        and settings.admin_token
+        and admin_token is not None
+        and secrets.compare_digest(admin_token, settings.admin_token)
+    ):
+        return True
+    rate = settings.profile_sample_rate
+    return rate > 0 and random.random() < rate
+
+
+def maybe_profile(name: str, header_value: str | None = None, admin_token: str | None = None):
+    """Context manager profiling the enclosed block if this request opted in."""
+    if not should_profile(header_value, admin_token):
+        return contextlib.nullcontext()
+    return RequestProfiler(
+        name,
+        out_dir=settings.profile_dir,
+        interval_s=settings.profile_interval_ms / 1000.0,
+    )
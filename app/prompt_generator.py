@@ -4,6 +4,17 @@ from typing import List, Dict
 
 from .schemas import PosterAnalysis
 
+# Campaign variants and the quality tier each one uses unless the request
+# asks for a specific tier. Thumbnails and teasers are shown small, so they
+# do not need full-resolution, full-step generations.
+# "size" and "layout" are used in master mode, where variants are cropped from
+# one key art image and the text is drawn locally (see app/compositor.py).
+VARIANTS: List[Dict] = [
+    {"variant": "theatrical poster", "quality": "final", "size": (1024, 1536), "layout": "poster"},
+    {"variant": "streaming thumbnail", "quality": "standard", "size": (1280, 720), "layout": "thumbnail"},
+    {"variant": "social media teaser", "quality": "standard", "size": (1080, 1080), "layout": "square"},
+]
+
 
 def build_poster_prompt(
     summary: str,
@@ -25,21 +36,44 @@ def build_poster_prompt(
     return base
 
 
+def build_master_prompt(
+    summary: str,
+    analysis: PosterAnalysis,
+    extra_style_hint: str | None = None,
+) -> str:
+    """
+    Prompt for the single key art image of a master-mode campaign. It asks for
+    no text at all: title and tagline are drawn onto each variant afterwards.
+    """
+    base = (
+        "Movie key art, cinematic composition, dramatic lighting, high detail, 4k. "
+        "Central subject in the middle of the frame with space around it. "
+        f"Genre: {analysis.genre}. Mood: {analysis.mood}. "
+        f"Color palette: {analysis.color_palette}. "
+        f"Visual style: {', '.join(analysis.visual_style_keywords)}. "
+        "No text, no lettering, no logos. "
+        f"Depict the following movie summary: {summary}. "
+    )
+    if extra_style_hint:
+        base += f"The overall style should feel {extra_style_hint}."
+    return base
+
+
 def generate_prompts(
     summary: str,
     analysis: PosterAnalysis,
     extra_style_hint: str | None = None,
+    quality: str | None = None,
 ) -> List[Dict]:
     """
     Generate multiple prompt variants (theatrical, streaming thumbnail, social teaser).
+
+    Each prompt carries the quality tier to render it with: `quality` when
+    given, otherwise the variant's own default from VARIANTS.
     """
-    variants = [
-        "theatrical poster",
-        "streaming thumbnail",
-        "social media teaser",
-    ]
     prompts = []
-    for v in variants:
+    for spec in VARIANTS:
+        v = spec["variant"]
         prompt = build_poster_prompt(summary, analysis, v, extra_style_hint)
-        prompts.append({"variant": v, "prompt": prompt})
+        prompts.append({"variant": v, "prompt": prompt, "quality": quality or spec["quality"]})
     return prompts
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import secrets
+from typing import Dict
+
+from pydantic import BaseModel
+
+
+class QualityTier(BaseModel):
+    """
+    Generation parameters for one quality tier.
+
+    width / height / num_inference_steps / guidance_scale are passed to the
+    Hugging Face text_to_image call; openai_quality is the closest equivalent
+    for the OpenAI images API, which keeps settings.image_size and has no seed.
+    """
+
+    name: str
+    width: int
+    height: int
+    num_inference_steps: int
+    guidance_scale: float
+    openai_quality: str
+
+
+# draft is 1/4 of the pixels and ~1/3 of the steps of final, so on SDXL it comes
+# back several times faster. The seed is carried over when promoting, which
+# makes the final render reproducible (the composition can still shift a little
+# because the latent size changes with resolution).
+QUALITY_TIERS: Dict[str, QualityTier] = {
+    "draft": QualityTier(
+        name="draft",
+        width=512,
+        height=512,
+        num_inference_steps=15,
+        guidance_scale=5.0,
+        openai_quality="low",
+    ),
+    "standard": QualityTier(
+        name="standard",
+        width=768,
+        height=768,
+        num_inference_steps=25,
+        guidance_scale=7.0,
+        openai_quality="medium",
+    ),
+    "final": QualityTier(
+        name="final",
+        width=1024,
+        height=1024,
+        num_inference_steps=40,
+        guidance_scale=7.5,
+        openai_quality="high",
+    ),
+}
+
+
+def resolve_tier(name: str | None, default: str = "standard") -> QualityTier:
+    """Look up a tier by name, falling back to `default` when name is None."""
+    key = (name or default).lower().strip()
+    if key not in QUALITY_TIERS:
+        raise ValueError(
+            f"Unknown quality tier '{key}'. Expected one of: {', '.join(QUALITY_TIERS)}"
+        )
+    return QUALITY_TIERS[key]
+
+
+def new_seed() -> int:
+    """Random seed for a new generation; returned to the caller so it can be reused."""
+    return secrets.randbelow(2**31)
@@ -1,5 +1,9 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
+
+
+QualityName = Literal["draft", "standard", "final"]
+CampaignMode = Literal["per_variant", "master"]
 
 
 class PosterRequest(BaseModel):
@@ -8,11 +12,28 @@ class PosterRequest(BaseModel):
         default=None,
         description="Optional extra style hint for the campaign",
     )
+    quality: Optional[QualityName] = Field(
+        default=None,
+        description="Quality tier for every image; overrides the per-variant defaults",
+    )
+    seed: Optional[int] = Field(
+        default=None,
+        description="Generation seed; reuse the returned seed to promote a draft to final",
+    )
+    campaign_mode: Optional[CampaignMode] = Field(
+        default=None,
+        description=(
+            "per_variant: one provider image per variant. "
+            "master: one key art image, variants cropped and titled locally"
+        ),
+    )
 
 
 class PosterResponse(BaseModel):
     image_url: str
     prompt: str
+    quality: Optional[str] = None
+    seed: Optional[int] = None
 
 
 class PosterAnalysis(BaseModel):
@@ -22,6 +43,8 @@ class PosterAnalysis(BaseModel):
     mood: str
     color_palette: str
     visual_style_keywords: List[str]
+    # Version of the genre classifier that produced `genre`
+    model_version: Optional[str] = None
 
 
 class PosterVariant(BaseModel):
@@ -29,13 +52,38 @@ class PosterVariant(BaseModel):
     variant: str
     prompt: str
     image_url: str
+    quality: Optional[str] = None
+    seed: Optional[int] = None
 
 
 class CampaignResponse(BaseModel):
+    campaign_id: Optional[str] = None
     title: str
     tagline: str
     genre: str
     mood: str
     color_palette: str
     visual_style_keywords: List[str]
+    model_version: Optional[str] = None
+    seed: Optional[int] = None
     variants: List[PosterVariant]
+
+
+class RegenerateRequest(BaseModel):
+    variants: List[str] = Field(
+        ...,
+        min_length=1,
+        description='Variant names to regenerate, e.g. ["social media teaser"]',
+    )
+    seed: Optional[int] = Field(
+        default=None,
+        description="New seed for these variants (default: a fresh random seed)",
+    )
+    style_hint: Optional[str] = Field(
+        default=None,
+        description="Style hint for these variants only (default: the campaign's)",
+    )
+    quality: Optional[QualityName] = Field(
+        default=None,
+        description="Quality tier for these variants (default: their previous tier)",
+    )
@@ -0,0 +1,173 @@
+"""
+Preload-and-fork multi-worker server.
+
+`uvicorn --workers N` starts every worker as a fresh interpreter, so each one
+imports torch/transformers and loads its own copy of the DistilBERT weights.
+This entry point instead loads the app and the classifier once in the parent,
+binds the listening socket, and then forks the workers. The weights (memory
+mapped from model.safetensors) and the imported modules are shared
+copy-on-write, so each extra worker costs little more than its own Python heap.
+
+Usage:
+
+    python -m app.serve --workers 4 --port 8000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+
+import uvicorn
+
+from .memory import process_memory
+
+logger = logging.getLogger("app.serve")
+
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f} MB"
+
+
+def _report_memory(pids: list[int]) -> None:
+    """Startup check: how much of each worker is private vs. shared with the others."""
+    parent = process_memory()
+    if parent is None:
+        logger.info("memory report unavailable (no /proc/<pid>/smaps_rollup)")
+        return
+
+    logger.info("parent   rss=%s", _mb(parent["rss"]))
+    for pid in pids:
+        mem = process_memory(pid)
+        if mem is None:
+            continue
+        logger.info(
+            "worker %d rss=%s unique=%s shared=%s pss=%s",
+            pid,
+            _mb(mem["rss"]),
+            _mb(mem["unique"]),
+            _mb(mem["shared"]),
+            _mb(mem["pss"]),
+        )
+
+
+def _run_worker(config: uvicorn.Config, sock, torch_threads: int) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    torch = sys.modules.get("torch")
+    if torch is not None and torch_threads > 0:
+        torch.set_num_threads(torch_threads)
+
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(config: uvicorn.Config, sock, torch_threads: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(config, sock, torch_threads)
+        except BaseException:
+            logger.exception("worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Preload the app once, then fork workers.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--torch-threads",
+        type=int,
+        default=0,
+        help="torch intra-op threads per worker (default: classifier_num_threads, else CPUs / workers).",
+    )
+    parser.add_argument(
+        "--check-delay",
+        type=float,
+        default=5.0,
+        help="Seconds after start-up before logging per-worker memory (0 disables).",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+
+    if not hasattr(os, "fork"):
+        raise SystemExit("app.serve needs os.fork(); use `uvicorn app.main:app` on this platform")
+
+    from .config import settings
+
+    torch_threads = (
+        args.torch_threads
+        or settings.classifier_num_threads
+        or max(1, (os.cpu_count() or 1) // args.workers)
+    )
+
+    # Import the app and load the classifier in the parent. No inference runs
+    # here: starting torch's thread pool before fork() is not fork-safe.
+    from .main import app
+    from .text_analysis import preload_classifier
+
+    try:
+        preload_classifier()
+        logger.info("classifier preloaded in parent %d", os.getpid())
+    except RuntimeError as e:
+        logger.warning("classifier not preloaded, workers will load it lazily: %s", e)
+
+    config = uvicorn.Config(app, host=args.host, port=args.port)
+    sock = config.bind_socket()
+
+    # Move everything allocated so far out of the GC's reach so collections in
+    # the workers do not touch (and un-share) those pages.
+    gc.collect()
+    gc.freeze()
+
+    workers = {_spawn(config, sock, torch_threads) for _ in range(args.workers)}
+    logger.info("started %d workers: %s", len(workers), sorted(workers))
+
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    check_at = time.monotonic() + args.check_delay if args.check_delay > 0 else None
+
+    while workers:
+        if check_at is not None and time.monotonic() >= check_at:
+            _report_memory(sorted(workers))
+            check_at = None
+
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+
+        workers.discard(pid)
+        if not stopping:
+            logger.warning("worker %d exited (status %d), restarting", pid, status)
+            workers.add(_spawn(config, sock, torch_threads))
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Allocation-lean JSON responses for image payloads.
+
+Generated images are kept as their encoded PNG buffer (EncodedImage) and only
+base64-encoded while the response body is streamed, a chunk at a time,
+straight from that buffer. Compared to building a data-URL string per image
+and a validated Pydantic response, this skips the getvalue() copy, the full
+base64 bytes and str, the data-URL concatenation, model validation of the
+multi-megabyte field and the final JSON string.
+
+A request also holds at most a budget of encoded images in memory
+(ImageBudget); images beyond it are spilled to anonymous temporary files and
+streamed from there. The files are deleted as soon as nothing references the
+image.
+"""
+
+from __future__ import annotations
+
+import binascii
+import io
+import json
+import os
+import tempfile
+import threading
+from typing import Iterator
+
+from fastapi.responses import StreamingResponse
+
+# Raw bytes base64-encoded per chunk; a multiple of 3 so chunks concatenate
+# without padding in the middle of the string (256 KiB of output each).
+CHUNK_BYTES = 3 * 64 * 1024
+
+
+class EncodedImage:
+    """
+    An encoded image that renders as a data URL when streamed. It is held in
+    memory (`data`) or, once spilled, in a temporary file (`file`).
+    """
+
+    def __init__(self, data=None, mime_type: str = "image/png", *, file=None):
+        self.mime_type = mime_type
+        self._file = file
+        if file is not None:
+            self._view = None
+            self._nbytes = os.fstat(file.fileno()).st_size
+            # Concurrent streams of the same image share the file position
+            self._file_lock = threading.Lock()
+        else:
+            # BytesIO.getbuffer() and bytes both give a zero-copy memoryview
+            self._view = memoryview(data.getbuffer() if isinstance(data, io.BytesIO) else data)
+            self._nbytes = self._view.nbytes
+
+    @classmethod
+    def from_pil(cls, image, format: str = "PNG") -> "EncodedImage":
+        buf = io.BytesIO()
+        image.save(buf, format=format)
+        return cls(buf, mime_type=f"image/{format.lower()}")
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def spill(self, dir: str | None = None) -> "EncodedImage":
+        """A copy of this image backed by an anonymous temporary file."""
+        if self._file is not None:
+            return self
+        file = tempfile.TemporaryFile(dir=dir)
+        file.write(self._view)
+        file.flush()
+        return EncodedImage(mime_type=self.mime_type, file=file)
+
+    def save(self, path: str) -> None:
+        """Write the encoded image to `path`, a chunk at a time."""
+        with open(path, "wb") as f:
+            for chunk in self._chunks(CHUNK_BYTES):
+                f.write(chunk)
+
+    def _chunks(self, chunk_bytes: int) -> Iterator[bytes]:
+        if self._file is None:
+            view = self._view
+            for start in range(0, len(view), chunk_bytes):
+                yield view[start : start + chunk_bytes]
+            return
+        for start in range(0, self._nbytes, chunk_bytes):
+            with self._file_lock:
+                self._file.seek(start)
+                chunk = self._file.read(chunk_bytes)
+            yield chunk
+
+    def iter_data_url(self, chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+        yield f"data:{self.mime_type};base64,".encode("ascii")
+        for chunk in self._chunks(chunk_bytes):
+            yield binascii.b2a_base64(chunk, newline=False)
+
+    def data_url(self) -> str:
+        """The whole data URL as one string (for callers that need a str)."""
+        return b"".join(self.iter_data_url()).decode("ascii")
+
+
+class SpoolStats:
+    """Process-wide count of images spilled to disk."""
+
+    def __init__(self):
+        self.images = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, nbytes: int) -> None:
+        with self._lock:
+            self.images += 1
+            self.bytes += nbytes
+
+    def snapshot(self) -> dict:
+        return {"spilled_images": self.images, "spilled_bytes": self.bytes}
+
+
+spool_stats = SpoolStats()
+
+
+class ImageBudget:
+    """
+    Per-request memory budget for encoded images. hold() keeps images in
+    memory until `max_bytes` is used up and spills every later image to a
+    temporary file in `spool_dir`. max_bytes <= 0 keeps everything in memory.
+    """
+
+    def __init__(self, max_bytes: int, spool_dir: str | None = None):
+        self.max_bytes = max_bytes
+        self.spool_dir = spool_dir
+        self.in_memory = 0
+
+    def hold(self, image: EncodedImage) -> EncodedImage:
+        if image.spilled or self.max_bytes <= 0 or self.in_memory + image.nbytes <= self.max_bytes:
+            if not image.spilled:
+                self.in_memory += image.nbytes
+            return image
+        spool_stats.record(image.nbytes)
+        return image.spill(self.spool_dir)
+
+
+def iter_json(value) -> Iterator[bytes]:
+    """
+    Serialise dicts / lists / JSON scalars like json.dumps, except that
+    EncodedImage values are streamed as data-URL strings chunk by chunk.
+    Base64 output needs no JSON escaping, so the chunks are emitted as-is.
+    """
+    if isinstance(value, EncodedImage):
+        yield b'"'
+        yield from value.iter_data_url()
+        yield b'"'
+    elif isinstance(value, dict):
+        yield b"{"
+        for i, (key, item) in enumerate(value.items()):
+            yield (b"," if i else b"") + json.dumps(str(key)).encode() + b":"
+            yield from iter_json(item)
+        yield b"}"
+    elif isinstance(value, (list, tuple)):
+        yield b"["
+        for i, item in enumerate(value):
+            if i:
+                yield b","
+            yield from iter_json(item)
+        yield b"]"
+    else:
+        yield json.dumps(value).encode()
+
+
+def _coalesce(chunks: Iterator[bytes], min_bytes: int = 64 * 1024) -> Iterator[bytes]:
+    """Merge the many small structural pieces so each body write is worthwhile."""
+    pending: list[bytes] = []
+    size = 0
+    for chunk in chunks:
+        if len(chunk) >= min_bytes:
+            if pending:
+                yield b"".join(pending)
+                pending, size = [], 0
+            yield chunk
+            continue
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= min_bytes:
+            yield b"".join(pending)
+            pending, size = [], 0
+    if pending:
+        yield b"".join(pending)
+
+
+def json_stream_response(value, headers: dict | None = None, profiler=None) -> StreamingResponse:
+    """`profiler` (a profiling.RequestProfiler) also covers streaming the body."""
+    body = _coalesce(iter_json(value))
+    if profiler is not None:
+        body = profiler.stream(body)
+    return StreamingResponse(body, media_type="application/json", headers=headers)
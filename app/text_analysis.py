@@ -1,13 +1,25 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import logging
+import mmap
 import os
 import re
+import struct
+import threading
+import time
+import weakref
 
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+# torch and transformers are imported inside the functions that need them, so
+# importing this module (and app.main) stays cheap until the classifier loads.
 
+from .config import settings
+from .deadline import Deadline, cancellation_stats
 from .schemas import PosterAnalysis
 
+logger = logging.getLogger(__name__)
+
 # Model directory produced by train_text_classifier.py
 MODEL_DIR = os.path.join(
     os.path.dirname(os.path.dirname(__file__)),
@@ -15,49 +27,299 @@ MODEL_DIR = os.path.join(
     "genre_classifier_distilbert",
 )
 
-_tokenizer = None
-_model = None
-_id2label = None
+# safetensors dtype names -> torch dtype attribute names
+_SAFETENSORS_DTYPES = {
+    "F64": "float64",
+    "F32": "float32",
+    "F16": "float16",
+    "BF16": "bfloat16",
+    "I64": "int64",
+    "I32": "int32",
+    "I16": "int16",
+    "I8": "int8",
+    "U8": "uint8",
+    "BOOL": "bool",
+}
+
+
+def _mmap_state_dict(path: str) -> dict:
+    """
+    Map a .safetensors file into memory and return tensors that view the
+    mapping directly instead of copying it into anonymous memory.
+
+    The mapping is private copy-on-write, so the weight pages stay in the page
+    cache and are shared by every process that maps the same file, including
+    workers forked by app.serve.
+    """
+    import torch
+
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    (header_len,) = struct.unpack("<Q", mm[:8])
+    header = json.loads(mm[8 : 8 + header_len])
+    data_start = 8 + header_len
+
+    state_dict = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = getattr(torch, _SAFETENSORS_DTYPES[info["dtype"]])
+        begin, end = info["data_offsets"]
+        tensor = torch.frombuffer(
+            mm,
+            dtype=dtype,
+            count=(end - begin) // dtype.itemsize,
+            offset=data_start + begin,
+        )
+        state_dict[name] = tensor.view(info["shape"])
+    return state_dict
+
+
+def _load_model(model_dir: str):
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+
+    weights = os.path.join(model_dir, "model.safetensors")
+    if not (settings.classifier_mmap_weights and os.path.isfile(weights)):
+        return AutoModelForSequenceClassification.from_pretrained(model_dir)
+
+    config = AutoConfig.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_config(config)
+    # assign=True swaps the freshly initialised parameters for the mapped tensors
+    model.load_state_dict(_mmap_state_dict(weights), assign=True)
+    return model
+
+
+# ---------- classifier handles / hot swap ----------
+
+# Files whose change means a new model version
+_MODEL_FILES = ("config.json", "model.safetensors", "pytorch_model.bin")
+_WARMUP_TEXTS = (
+    "A detective hunts a killer through a city that never sleeps.",
+    "Two strangers fall in love on a summer road trip.",
+)
+
+
+class ClassifierHandle:
+    """
+    One loaded classifier version. A handle is never modified: a reload builds
+    a new one and swaps the module reference, and callers keep using the
+    handle they started with. The old model is freed when its last caller
+    drops the reference.
+    """
+
+    def __init__(self, tokenizer, model, id2label: dict, version: str):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.id2label = id2label
+        self.version = version
+        self.loaded_at = time.time()
+
+    def predict(self, summary: str) -> str:
+        import torch
+
+        inputs = self.tokenizer(
+            summary,
+            return_tensors="pt",
+            truncation=True,
+            padding=True,
+            max_length=settings.classifier_max_length,
+        )
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+            logits = outputs.logits
+            pred_id = int(torch.argmax(logits, dim=-1).item())
+        return self.id2label[pred_id]
+
+
+_active: ClassifierHandle | None = None
+_load_lock = threading.Lock()
+_reload_lock = threading.Lock()
+# Swapped-out handles still referenced by in-flight predictions
+_retired: "weakref.WeakSet[ClassifierHandle]" = weakref.WeakSet()
+_seen_fingerprint: tuple | None = None
+_reload_status = {"state": "idle", "last_result": None, "error": None, "finished_at": None}
 
 
-def _load_classifier():
-    """Lazy load finetuned classifier."""
-    global _tokenizer, _model, _id2label
-    if _tokenizer is not None and _model is not None:
-        return
+def _model_version(model_dir: str) -> str:
+    """
+    Short hash identifying the model files, cheap enough for every load.
 
-    if not os.path.isdir(MODEL_DIR):
+    Covers config.json, the safetensors header (tensor names, dtypes, shapes,
+    offsets) and each model file's size and mtime, instead of hashing
+    hundreds of MB of weights. Files copied with their mtime (e.g. in a
+    Docker image) keep their version; a retrained model always gets a new one.
+    """
+    digest = hashlib.sha256()
+    for name, _inode, mtime_ns, size in _fingerprint(model_dir):
+        digest.update(f"{name}:{size}:{mtime_ns};".encode())
+
+    config = os.path.join(model_dir, "config.json")
+    if os.path.isfile(config):
+        with open(config, "rb") as f:
+            digest.update(f.read())
+    weights = os.path.join(model_dir, "model.safetensors")
+    if os.path.isfile(weights):
+        with open(weights, "rb") as f:
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            digest.update(f.read(header_len))
+    return digest.hexdigest()[:12]
+
+
+def _fingerprint(model_dir: str) -> tuple:
+    """Cheap change detector for the file watcher (inode, mtime and size)."""
+    entries = []
+    for name in _MODEL_FILES:
+        try:
+            st = os.stat(os.path.join(model_dir, name))
+        except FileNotFoundError:
+            continue
+        entries.append((name, st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(entries)
+
+
+def _load_handle(model_dir: str, version: str | None = None) -> ClassifierHandle:
+    if not os.path.isdir(model_dir):
         raise RuntimeError(
-            f"Genre classifier not found at {MODEL_DIR}. "
+            f"Genre classifier not found at {model_dir}. "
             "Please run `python train_text_classifier.py` first."
         )
 
-    _tokenizer = AutoTokenizer.from_pretrained(MODEL_DIR)
-    _model = AutoModelForSequenceClassification.from_pretrained(MODEL_DIR)
-    _model.eval()
+    from transformers import AutoTokenizer
+
+    version = version or _model_version(model_dir)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = _load_model(model_dir)
+    model.eval()
 
-    id2label = _model.config.id2label
+    id2label = model.config.id2label
     # HF config may use string keys: {"0": "Action", "1": "Drama", ...}
     if isinstance(id2label, dict):
         id2label = {int(k): v for k, v in id2label.items()}
-    _id2label = id2label
+    return ClassifierHandle(tokenizer, model, id2label, version)
+
+
+def _load_classifier() -> ClassifierHandle:
+    """Lazy load finetuned classifier; returns the active handle."""
+    global _active, _seen_fingerprint
+    handle = _active
+    if handle is not None:
+        return handle
+
+    with _load_lock:
+        if _active is None:
+            if settings.classifier_num_threads > 0:
+                import torch
+
+                torch.set_num_threads(settings.classifier_num_threads)
+            fingerprint = _fingerprint(MODEL_DIR)
+            _active = _load_handle(MODEL_DIR)
+            _seen_fingerprint = fingerprint
+        return _active
+
+
+def preload_classifier() -> None:
+    """Load the classifier eagerly, e.g. in the app.serve parent before forking."""
+    _load_classifier()
+
+
+def reload_classifier(model_dir: str = MODEL_DIR, force: bool = False) -> dict:
+    """
+    Load the model in `model_dir`, warm it up and swap it in.
+
+    Runs in the caller's thread; predictions keep using the current model
+    meanwhile. Nothing is swapped when the new files hash to the active
+    version, unless `force` is set. Returns classifier_status().
+    """
+    global _active, _seen_fingerprint
+    with _reload_lock:
+        _reload_status.update(state="loading", error=None)
+        fingerprint = _fingerprint(model_dir)
+        try:
+            version = _model_version(model_dir)
+            if not force and _active is not None and version == _active.version:
+                result = "unchanged"
+            else:
+                handle = _load_handle(model_dir, version)
+                # First calls pay for lazy allocations; do them before the swap
+                for text in _WARMUP_TEXTS:
+                    handle.predict(text)
+                with _load_lock:
+                    old, _active = _active, handle
+                if old is not None:
+                    _retired.add(old)
+                    del old
+                result = "swapped"
+                logger.info("genre classifier %s swapped in", handle.version)
+            _reload_status.update(last_result=result)
+        except Exception as e:
+            logger.exception("genre classifier reload failed")
+            _reload_status.update(last_result="failed", error=f"{type(e).__name__}: {e}")
+        finally:
+            _seen_fingerprint = fingerprint
+            _reload_status.update(state="idle", finished_at=time.time())
+    return classifier_status()
+
+
+def start_reload(model_dir: str = MODEL_DIR, force: bool = False) -> bool:
+    """reload_classifier() in a background thread; False if one is already running."""
+    if _reload_lock.locked():
+        return False
+    threading.Thread(
+        target=reload_classifier,
+        args=(model_dir, force),
+        name="classifier-reload",
+        daemon=True,
+    ).start()
+    return True
+
+
+def start_classifier_watcher(interval_s: float) -> threading.Event:
+    """
+    Poll the model files every `interval_s` seconds and hot-swap the model
+    when they change and have stayed unchanged for one more interval (so a
+    half-written file is not loaded). Set the returned event to stop.
+    """
+    stop = threading.Event()
+
+    def watch():
+        pending = None
+        while not stop.wait(interval_s):
+            if _active is None:
+                # Not loaded yet; the first prediction loads the current files
+                continue
+            fingerprint = _fingerprint(MODEL_DIR)
+            if fingerprint == _seen_fingerprint:
+                pending = None
+            elif fingerprint != pending:
+                pending = fingerprint
+            else:
+                pending = None
+                reload_classifier(MODEL_DIR)
+
+    threading.Thread(target=watch, name="classifier-watcher", daemon=True).start()
+    return stop
+
+
+def classifier_status() -> dict:
+    handle = _active
+    return {
+        "model_version": handle.version if handle is not None else None,
+        "loaded_at": handle.loaded_at if handle is not None else None,
+        "retired_in_use": len(_retired),
+        "reload": dict(_reload_status),
+    }
+
+
+def predict_genre_with_version(summary: str) -> tuple[str, str]:
+    """predict_genre() plus the version of the model that made the prediction."""
+    handle = _load_classifier()
+    return handle.predict(summary), handle.version
 
 
 def predict_genre(summary: str) -> str:
     """Predict a primary genre label for the given movie summary."""
-    _load_classifier()
-    inputs = _tokenizer(
-        summary,
-        return_tensors="pt",
-        truncation=True,
-        padding=True,
-        max_length=256,
-    )
-    with torch.no_grad():
-        outputs = _model(**inputs)
-        logits = outputs.logits
-        pred_id = int(torch.argmax(logits, dim=-1).item())
-    return _id2label[pred_id]
+    return _load_classifier().predict(summary)
 
 
 # ---------- simple rule-based mappings based on genre ----------
@@ -166,15 +428,25 @@ def _make_tagline(genre: str, mood: str) -> str:
     return f"A {mood} {core}."
 
 
-def analyze_summary(summary: str, style_hint: str | None = None) -> PosterAnalysis:
+def analyze_summary(
+    summary: str,
+    style_hint: str | None = None,
+    deadline: Deadline | None = None,
+) -> PosterAnalysis:
     """
     Full Text Analysis pipeline WITHOUT OpenAI:
 
     1) Predict genre using finetuned classifier.
     2) Use simple rules (based on genre) to derive:
        mood, color palette, visual style keywords, title, tagline.
+
+    The classifier is not run once `deadline` is done (RequestCancelled).
     """
-    genre = predict_genre(summary)
+    if deadline is not None and deadline.is_done():
+        cancellation_stats.add("classifier_runs_skipped")
+        raise deadline.error()
+
+    genre, model_version = predict_genre_with_version(summary)
     mood = _infer_mood(genre)
     color_palette = _infer_color_palette(genre)
     visual_style_keywords = _infer_style_keywords(genre)
@@ -188,4 +460,5 @@ def analyze_summary(summary: str, style_hint: str | None = None) -> PosterAnalys
         mood=mood,
         color_palette=color_palette,
         visual_style_keywords=visual_style_keywords,
+        model_version=model_version,
     )
@@ -0,0 +1,246 @@
+"""
+Offline throughput / accuracy benchmark for the genre classifier.
+
+Sweeps batch size x max sequence length x torch threads x inference backend
+over the saved model in models/genre_classifier_distilbert and writes one
+JSON line per configuration:
+
+    {"backend", "batch_size", "max_length", "threads", "model_version",
+     "latency_ms": {"p50", "p90", "p99", "mean"}, "rows_per_s",
+     "peak_rss_mb", "agreement", "n_rows", "error"}
+
+latency_ms is per batch; agreement is the top-1 agreement with the reference
+configuration (the current production setting: eager, max_length from
+Settings, default 256). Every configuration runs in a fresh process so
+peak_rss_mb is not polluted by earlier runs.
+
+Example:
+
+    python benchmark_classifier.py --summaries summaries.txt \
+        --batch-sizes 1,8,32 --max-lengths 128,256 --threads 1,4 \
+        --backends eager,int8 --output bench.jsonl
+"""
+
+import os
+os.environ["TRANSFORMERS_NO_TF"] = "1"
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from app.config import settings
+from app.text_analysis import MODEL_DIR, _model_version
+
+# parameters
+
+DEFAULT_BATCH_SIZES = "1,8,32"
+DEFAULT_MAX_LENGTHS = "64,128,256"
+DEFAULT_THREADS = "1,2,4"
+DEFAULT_BACKENDS = "eager,int8"
+NUM_SAMPLES = 512
+WARMUP_BATCHES = 2
+
+BACKENDS = ("eager", "int8", "bf16", "compile")
+
+
+def load_summaries(path: str | None, num_samples: int) -> List[str]:
+    """
+    Summaries from a .txt (one per line) or .jsonl ("summary" or "description"
+    field) file; without a file, the test split of the training dataset.
+    """
+    if path is None:
+        from datasets import load_dataset
+
+        test = load_dataset("jquigl/imdb-genres", split="test")
+        texts = list(test.shuffle(seed=42)["description"])
+    elif path.endswith(".jsonl"):
+        texts = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    texts.append(row.get("summary") or row["description"])
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    if not texts:
+        raise SystemExit("No summaries to benchmark")
+    # Repeat a short file so every configuration sees the same num_samples rows
+    return list(itertools.islice(itertools.cycle(texts), num_samples))
+
+
+def _prepare_model(backend: str):
+    import torch
+    from app.text_analysis import _load_model
+
+    model = _load_model(MODEL_DIR)
+    model.eval()
+
+    if backend == "int8":
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    elif backend == "bf16":
+        model = model.to(torch.bfloat16)
+    elif backend == "compile":
+        model = torch.compile(model)
+    elif backend != "eager":
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    return model
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_config(config: Dict, summaries: List[str]) -> Dict:
+    """Benchmark one configuration; runs in its own process."""
+    import torch
+    from transformers import AutoTokenizer
+
+    torch.set_num_threads(config["threads"])
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_DIR)
+    model = _prepare_model(config["backend"])
+
+    batch_size = config["batch_size"]
+    batches = [summaries[i : i + batch_size] for i in range(0, len(summaries), batch_size)]
+
+    def predict(batch):
+        inputs = tokenizer(
+            batch,
+            return_tensors="pt",
+            truncation=True,
+            padding=True,
+            max_length=config["max_length"],
+        )
+        with torch.no_grad():
+            logits = model(**inputs).logits
+        return torch.argmax(logits, dim=-1).tolist()
+
+    for batch in batches[:WARMUP_BATCHES]:
+        predict(batch)
+
+    latencies: List[float] = []
+    preds: List[int] = []
+    start = time.perf_counter()
+    for batch in batches:
+        t0 = time.perf_counter()
+        preds.extend(predict(batch))
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+    return {
+        **config,
+        "n_rows": len(preds),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50), 3),
+            "p90": round(_percentile(latencies, 90), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+            "mean": round(statistics.fmean(latencies), 3),
+        },
+        "rows_per_s": round(len(preds) / elapsed, 2),
+        "peak_rss_mb": round(peak_mb, 1),
+        "predictions": preds,
+        "error": None,
+    }
+
+
+def _run_isolated(config: Dict, summaries: List[str]) -> Dict:
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        try:
+            return pool.submit(run_config, config, summaries).result()
+        except Exception as e:
+            return {**config, "error": f"{type(e).__name__}: {e}"}
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the genre classifier.")
+    parser.add_argument("--summaries", default=None, help="Input .txt or .jsonl (default: imdb-genres test split).")
+    parser.add_argument("--num-samples", type=int, default=NUM_SAMPLES)
+    parser.add_argument("--batch-sizes", default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--max-lengths", default=DEFAULT_MAX_LENGTHS)
+    parser.add_argument("--threads", default=DEFAULT_THREADS)
+    parser.add_argument("--backends", default=DEFAULT_BACKENDS, help=f"Any of {','.join(BACKENDS)}.")
+    parser.add_argument("--output", default=None, help="JSON lines output file (default: stdout).")
+    args = parser.parse_args()
+
+    if not os.path.isdir(MODEL_DIR):
+        raise SystemExit(f"Genre classifier not found at {MODEL_DIR}. Run train_text_classifier.py first.")
+
+    summaries = load_summaries(args.summaries, args.num_samples)
+    # Same content hash the server reports, so results can be matched to a model
+    model_version = _model_version(MODEL_DIR)
+
+    reference = {
+        "backend": "eager",
+        "batch_size": 1,
+        "max_length": settings.classifier_max_length,
+        "threads": _ints(args.threads)[0],
+    }
+    print(f"Reference configuration: {reference}, model {model_version}", file=sys.stderr)
+    ref_result = _run_isolated(reference, summaries)
+    if ref_result["error"]:
+        raise SystemExit(f"Reference run failed: {ref_result['error']}")
+    ref_preds = ref_result["predictions"]
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for backend, batch_size, max_length, threads in itertools.product(
+            [b.strip() for b in args.backends.split(",") if b.strip()],
+            _ints(args.batch_sizes),
+            _ints(args.max_lengths),
+            _ints(args.threads),
+        ):
+            config = {
+                "backend": backend,
+                "batch_size": batch_size,
+                "max_length": max_length,
+                "threads": threads,
+            }
+            result = ref_result if config == reference else _run_isolated(config, summaries)
+            result["model_version"] = model_version
+            preds = result.pop("predictions", None)
+            result["agreement"] = (
+                round(sum(a == b for a, b in zip(preds, ref_preds)) / len(ref_preds), 4)
+                if preds is not None
+                else None
+            )
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+
+            if result["error"]:
+                print(f"{config} -> ERROR {result['error']}", file=sys.stderr)
+            else:
+                print(
+                    f"{backend:>7} bs={batch_size:<3} len={max_length:<4} thr={threads:<2} "
+                    f"p50={result['latency_ms']['p50']:.1f}ms p99={result['latency_ms']['p99']:.1f}ms "
+                    f"{result['rows_per_s']:.1f} rows/s rss={result['peak_rss_mb']:.0f}MB "
+                    f"agree={result['agreement']:.3f}",
+                    file=sys.stderr,
+                )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.admission import AdaptiveLimit, AdmissionMiddleware, EndpointGate, build_gates
+from app.config import settings
+
+
+def test_gate_queues_then_sheds():
+    async def scenario():
+        gate = EndpointGate("test", max_concurrency=1, max_queue=1, queue_timeout_s=0.05)
+        assert await gate.acquire()
+        queued = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        assert gate.waiting == 1
+        # Concurrency and queue are both full: rejected without waiting
+        assert not await gate.acquire()
+        await gate.release()
+        assert await queued
+        # Queue timeout also rejects
+        assert not await gate.acquire()
+        return gate.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["admitted"] == 2
+    assert stats["rejected"] == 2
+
+
+def test_adaptive_limit_shrinks_on_latency_spike():
+    limit = AdaptiveLimit(initial=8, max_limit=16)
+    for _ in range(50):
+        limit.record(1.0)
+    steady = limit.limit
+    for _ in range(10):
+        limit.record(10.0)
+    assert limit.limit < steady
+
+
+def test_fast_failures_shrink_limit():
+    limit = AdaptiveLimit(initial=8, max_limit=16)
+    for _ in range(50):
+        limit.record(1.0)
+    steady = limit.limit
+    for _ in range(10):
+        limit.record_failure(0.01)
+    assert limit.limit < steady
+
+
+def _default_campaign_gate():
+    """The /generate_campaign gate as built from the Settings defaults."""
+    limit = AdaptiveLimit(
+        initial=settings.adaptive_initial_limit,
+        max_limit=max(settings.campaign_max_concurrency, settings.poster_max_concurrency),
+        tolerance=settings.adaptive_latency_tolerance,
+    )
+    gate = build_gates()["/generate_campaign"]
+    gate.adaptive = limit
+    for _ in range(50):
+        limit.record(1.0)
+    assert gate.capacity() == settings.campaign_max_concurrency
+    return gate, limit
+
+
+def test_default_campaign_capacity_drops_on_latency_spike():
+    gate, limit = _default_campaign_gate()
+    for _ in range(10):
+        limit.record(30.0)
+    assert gate.capacity() < settings.campaign_max_concurrency
+
+    for _ in range(50):
+        limit.record(1.0)
+    assert gate.capacity() == settings.campaign_max_concurrency
+
+
+def test_default_campaign_capacity_drops_on_fast_failures():
+    gate, limit = _default_campaign_gate()
+    for _ in range(20):
+        limit.record_failure(0.01)
+    assert gate.capacity() < settings.campaign_max_concurrency
+
+
+def test_429_carries_cors_headers():
+    from app.main import app, gates
+
+    gate = gates["/generate_campaign"]
+    max_queue = gate.max_queue
+    gate.in_flight, gate.max_queue = gate.max_concurrency, 0
+    try:
+        r = TestClient(app).post(
+            "/generate_campaign", json={"summary": "x"}, headers={"Origin": "https://example.com"}
+        )
+    finally:
+        gate.in_flight, gate.max_queue = 0, max_queue
+    assert r.status_code == 429
+    assert r.headers["access-control-allow-origin"] == "*"
+
+
+def test_middleware_returns_429_with_retry_after():
+    app = FastAPI()
+    gate = EndpointGate("busy", max_concurrency=1, max_queue=0, queue_timeout_s=0.1)
+    gate.in_flight = 1
+    app.add_middleware(AdmissionMiddleware, gates={"/busy": gate})
+
+    @app.get("/busy")
+    def busy():
+        return {}
+
+    r = TestClient(app).get("/busy")
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+
+
+def test_slot_held_until_abandoned_work_returns():
+    gate = EndpointGate("slow", max_concurrency=1, max_queue=0, queue_timeout_s=0.1)
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    abandoned = executor.submit(release.wait, 5)
+
+    async def endpoint(scope, receive, send):
+        # What _run_pipeline leaves behind after a 504
+        scope.setdefault("state", {})["pending_work"] = [abandoned]
+        await JSONResponse({"detail": "timeout"}, status_code=504)(scope, receive, send)
+
+    middleware = AdmissionMiddleware(endpoint, gates={"/slow": gate})
+
+    async def scenario():
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        scope = {"type": "http", "path": "/slow", "method": "POST", "headers": []}
+        task = asyncio.ensure_future(middleware(scope, receive, send))
+        await asyncio.sleep(0.1)
+        # The client already has its 504, but the slot stays taken
+        assert sent[0]["status"] == 504
+        assert (gate.in_flight, gate.draining) == (1, 1)
+        release.set()
+        await task
+        assert (gate.in_flight, gate.draining) == (0, 0)
+
+    asyncio.run(scenario())
+    executor.shutdown()
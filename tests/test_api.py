@@ -6,3 +6,74 @@ client = TestClient(app)
 def test_health():
     r = client.get("/health")
     assert r.status_code == 200
+
+def test_invalid_quality_tier_rejected():
+    r = client.post("/generate_campaign", json={"summary": "x", "quality": "ultra"})
+    assert r.status_code == 422
+
+
+def _fake_pipeline(monkeypatch):
+    import app.main as main
+    from app.schemas import PosterAnalysis
+    from app.streaming import EncodedImage
+
+    analysis = PosterAnalysis(
+        title="T",
+        tagline="Tag",
+        genre="Drama",
+        mood="dramatic",
+        color_palette="warm",
+        visual_style_keywords=["cinematic"],
+    )
+    calls = []
+
+    def fake_images(prompts, num_images_per_variant, seed, deadline=None):
+        calls.extend(p["variant"] for p in prompts)
+        return [{**p, "image_url": EncodedImage(b"png"), "seed": seed} for p in prompts]
+
+    monkeypatch.setattr(main, "analyze_summary", lambda summary, hint, deadline=None: analysis)
+    monkeypatch.setattr(main, "generate_images_for_campaign", fake_images)
+    return calls
+
+
+def test_generate_campaign_streams_json(monkeypatch):
+    _fake_pipeline(monkeypatch)
+
+    r = client.post("/generate_campaign", json={"summary": "x", "seed": 5})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["seed"] == 5
+    assert [v["image_url"] for v in body["variants"]] == ["data:image/png;base64,cG5n"] * 3
+
+
+def test_regenerate_single_variant(monkeypatch):
+    calls = _fake_pipeline(monkeypatch)
+    campaign = client.post("/generate_campaign", json={"summary": "x", "seed": 5}).json()
+    calls.clear()
+
+    r = client.post(
+        f"/campaigns/{campaign['campaign_id']}/regenerate",
+        json={"variants": ["social media teaser"], "seed": 9, "style_hint": "neon"},
+    )
+    assert r.status_code == 200
+    assert calls == ["social media teaser"]
+    seeds = {v["variant"]: v["seed"] for v in r.json()["variants"]}
+    assert seeds == {"theatrical poster": 5, "streaming thumbnail": 5, "social media teaser": 9}
+
+
+def test_regenerate_unknown_campaign():
+    r = client.post("/campaigns/missing/regenerate", json={"variants": ["theatrical poster"]})
+    assert r.status_code == 404
+
+
+def test_openai_images_have_no_seed(monkeypatch):
+    from app import poster_generator
+
+    monkeypatch.setattr(poster_generator.settings, "image_provider", "openai")
+    monkeypatch.setattr(poster_generator, "get_openai_client", lambda: None)
+    monkeypatch.setattr(poster_generator, "_openai_image", lambda client, prompt, tier, deadline=None: "https://img")
+
+    images = poster_generator.generate_images_for_campaign(
+        [{"variant": "v", "prompt": "p", "quality": "draft"}], seed=5
+    )
+    assert images[0]["seed"] is None
@@ -0,0 +1,61 @@
+from app.campaign_store import CampaignStore
+from app.streaming import EncodedImage
+
+
+def _record():
+    return {
+        "seed": 1,
+        "variants": [
+            {"variant": name, "image_url": EncodedImage(b"png-" + name.encode()), "seed": 1}
+            for name in ("a", "b")
+        ],
+    }
+
+
+def test_stored_images_are_spilled(tmp_path):
+    store = CampaignStore(max_entries=4, ttl_s=60, root=str(tmp_path))
+    record = _record()
+    campaign_id = store.add(record)
+
+    assert all(v["image_url"].spilled for v in store.get(campaign_id)["variants"])
+    # The caller's copy, used for the response, stays in memory
+    assert not any(v["image_url"].spilled for v in record["variants"])
+
+
+def test_concurrent_regenerations_both_kept(tmp_path):
+    store = CampaignStore(max_entries=4, ttl_s=60, root=str(tmp_path))
+    campaign_id = store.add(_record())
+    # Two regenerations that both read the record before either wrote it back
+    snapshot = store.get(campaign_id)
+    store.merge_variants(campaign_id, {"a": {"seed": 2}}, fallback=snapshot)
+    merged = store.merge_variants(campaign_id, {"b": {"seed": 3}}, fallback=snapshot)
+
+    assert {v["variant"]: v["seed"] for v in merged["variants"]} == {"a": 2, "b": 3}
+    assert {v["variant"]: v["seed"] for v in store.get(campaign_id)["variants"]} == {"a": 2, "b": 3}
+
+
+def test_campaigns_are_shared_between_workers(tmp_path):
+    # Two stores on one directory, as in two app.serve workers
+    creator = CampaignStore(max_entries=4, ttl_s=60, root=str(tmp_path))
+    other = CampaignStore(max_entries=4, ttl_s=60, root=str(tmp_path))
+    campaign_id = creator.add(_record())
+
+    record = other.get(campaign_id)
+    assert record["variants"][0]["image_url"].data_url() == EncodedImage(b"png-a").data_url()
+
+    other.merge_variants(campaign_id, {"a": {"image_url": EncodedImage(b"new-a"), "seed": 2}}, fallback=record)
+    updated = creator.get(campaign_id)["variants"][0]
+    assert updated["seed"] == 2
+    assert updated["image_url"].data_url() == EncodedImage(b"new-a").data_url()
+    # The replaced image file is gone
+    assert len(list((tmp_path / campaign_id).glob("*.png"))) == 2
+
+
+def test_least_recently_used_campaign_evicted(tmp_path):
+    store = CampaignStore(max_entries=1, ttl_s=60, root=str(tmp_path))
+    first = store.add(_record())
+    second = store.add(_record())
+
+    assert store.get(first) is None
+    assert store.get(second) is not None
+    assert len(store) == 1
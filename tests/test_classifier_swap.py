@@ -0,0 +1,65 @@
+import gc
+
+from app import text_analysis
+from app.text_analysis import ClassifierHandle
+
+
+class FakeHandle(ClassifierHandle):
+    def __init__(self, version):
+        super().__init__(tokenizer=None, model=None, id2label={}, version=version)
+        self.calls = 0
+
+    def predict(self, summary):
+        self.calls += 1
+        return f"Genre-{self.version}"
+
+
+def test_reload_swaps_atomically_and_retires_old_model(monkeypatch, tmp_path):
+    versions = iter(["v1", "v2"])
+    current = {"version": "v1"}
+    monkeypatch.setattr(text_analysis, "MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(text_analysis, "_model_version", lambda model_dir: current["version"])
+    monkeypatch.setattr(text_analysis, "_load_handle", lambda model_dir, version=None: FakeHandle(next(versions)))
+    monkeypatch.setattr(text_analysis, "_active", None)
+
+    assert text_analysis.predict_genre_with_version("x") == ("Genre-v1", "v1")
+
+    # Same files: nothing is reloaded
+    status = text_analysis.reload_classifier(str(tmp_path))
+    assert status["reload"]["last_result"] == "unchanged"
+
+    # A request still holding the old model while the new one is swapped in
+    in_flight = text_analysis._load_classifier()
+    current["version"] = "v2"
+    status = text_analysis.reload_classifier(str(tmp_path))
+    assert status["reload"]["last_result"] == "swapped"
+    assert status["model_version"] == "v2"
+    # The new model was warmed up before the swap
+    assert text_analysis._active.calls == len(text_analysis._WARMUP_TEXTS)
+    assert status["retired_in_use"] == 1
+    assert in_flight.predict("x") == "Genre-v1"
+    assert text_analysis.predict_genre("x") == "Genre-v2"
+
+    del in_flight
+    gc.collect()
+    assert text_analysis.classifier_status()["retired_in_use"] == 0
+
+
+def test_model_version_reads_only_the_header(tmp_path):
+    import json
+    import os
+    import struct
+
+    header = json.dumps({"w": {"dtype": "F32", "shape": [4], "data_offsets": [0, 16]}}).encode()
+    weights = tmp_path / "model.safetensors"
+    weights.write_bytes(struct.pack("<Q", len(header)) + header + b"\0" * 16)
+    (tmp_path / "config.json").write_text("{}")
+
+    version = text_analysis._model_version(str(tmp_path))
+    assert text_analysis._model_version(str(tmp_path)) == version
+
+    # Same size and header, new weights: the changed mtime gives a new version
+    stat = weights.stat()
+    weights.write_bytes(struct.pack("<Q", len(header)) + header + b"\1" * 16)
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert text_analysis._model_version(str(tmp_path)) != version
@@ -0,0 +1,48 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from app import clients
+from app.config import settings
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_pool_stats_count_connection_reuse():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stats = clients.PoolStats()
+    try:
+        with httpx.Client(event_hooks={"request": [stats.request_hook]}) as client:
+            for _ in range(3):
+                client.get(f"http://127.0.0.1:{server.server_port}/")
+    finally:
+        server.shutdown()
+
+    snapshot = stats.snapshot()
+    assert snapshot["requests"] == 3
+    assert snapshot["connections_opened"] == 1
+    assert snapshot["connections_reused"] == 2
+
+
+def test_openai_client_is_shared(monkeypatch):
+    monkeypatch.setattr(settings, "openai_api_key", "sk-test")
+    try:
+        first = clients.get_openai_client()
+        assert clients.get_openai_client() is first
+    finally:
+        clients.close_clients()
+    assert clients.get_openai_client() is not first
+    clients.close_clients()
@@ -0,0 +1,55 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import poster_generator
+from app.deadline import ClientDisconnected, Deadline, DeadlineExceeded, cancellation_stats
+
+
+def test_wait_gives_up_on_slow_future():
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(release.wait, 5)
+        deadline = Deadline(0.2)
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            deadline.wait(future)
+        assert time.monotonic() - start < 1.0
+        release.set()
+
+
+def test_cancelled_campaign_skips_remaining_variants(monkeypatch):
+    monkeypatch.setattr(poster_generator.settings, "image_provider", "huggingface")
+    monkeypatch.setattr(poster_generator, "_hf_client", lambda timeout=None: None)
+    deadline = Deadline()
+    calls = []
+
+    def fake_text_to_image(client, prompt, tier, seed, negative_prompt=None):
+        from PIL import Image
+
+        calls.append(prompt)
+        # The client disconnects while the first image is being generated
+        deadline.cancel()
+        return Image.new("RGB", (8, 8))
+
+    monkeypatch.setattr(poster_generator, "_hf_text_to_image", fake_text_to_image)
+    before = cancellation_stats.snapshot()
+
+    prompts = [{"variant": f"v{i}", "prompt": f"p{i}", "quality": "draft"} for i in range(3)]
+    with pytest.raises(ClientDisconnected):
+        poster_generator.generate_images_for_campaign(prompts, seed=1, deadline=deadline)
+
+    after = cancellation_stats.snapshot()
+    assert calls == ["p0"]
+    assert after.get("encodes_skipped", 0) - before.get("encodes_skipped", 0) == 1
+    # The two variants after the cancelled call never reached the provider
+    assert after.get("provider_calls_skipped", 0) - before.get("provider_calls_skipped", 0) == 2
+
+
+def test_provider_timeout_caps_call_timeout(monkeypatch):
+    monkeypatch.setattr(poster_generator.settings, "provider_timeout_s", 120.0)
+    assert poster_generator._call_timeout(Deadline(300)) == 120.0
+    assert poster_generator._call_timeout(Deadline(30)) <= 30.0
+    assert poster_generator._call_timeout(None) is None
@@ -0,0 +1,54 @@
+"""
+Import-time budget for the API and the CLI tools.
+
+Heavy dependencies (torch, transformers, provider SDKs, PIL) must stay out of
+`import app.main`; they are imported lazily on first use. IMPORT_BUDGET_MS
+overrides the budget for slow CI machines.
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "1000"))
+HEAVY_MODULES = ("torch", "transformers", "openai", "huggingface_hub", "PIL", "requests")
+
+
+def _import_time_ms(module: str) -> float:
+    """Cumulative -X importtime of `module` in a fresh interpreter, best of 3 runs."""
+    best = float("inf")
+    for _ in range(3):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for line in proc.stderr.splitlines():
+            # "import time: <self us> | <cumulative us> | <module>"
+            parts = [p.strip() for p in line.split("|")]
+            if len(parts) == 3 and parts[2] == module:
+                best = min(best, int(parts[1]) / 1000.0)
+    return best
+
+
+def _heavy_modules_loaded(module: str) -> list:
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip()
+    return [m for m in out.split(",") if m]
+
+
+def test_app_import_skips_heavy_dependencies():
+    assert _heavy_modules_loaded("app.main") == []
+
+
+def test_app_import_time_budget():
+    assert _import_time_ms("app.main") < BUDGET_MS
+
+
+def test_save_poster_import_is_light():
+    assert _heavy_modules_loaded("save_poster") == []
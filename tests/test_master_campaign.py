@@ -0,0 +1,74 @@
+import base64
+import io
+
+from PIL import Image, ImageDraw
+
+from app import poster_generator
+from app.compositor import smart_crop
+from app.schemas import PosterAnalysis
+
+ANALYSIS = PosterAnalysis(
+    title="Steel Reborn",
+    tagline="The war evolves.",
+    genre="Action",
+    mood="dynamic and energetic",
+    color_palette="high-contrast oranges and blues",
+    visual_style_keywords=["epic scale"],
+)
+
+
+def _key_art(size=(1024, 1024)):
+    image = Image.new("RGB", size, (20, 30, 60))
+    ImageDraw.Draw(image).ellipse((760, 300, 1000, 700), fill=(250, 200, 40))
+    return image
+
+
+def test_smart_crop_keeps_subject():
+    cropped = smart_crop(_key_art(), (576, 1024))
+    assert cropped.size == (576, 1024)
+    # The bright subject sits at the right edge of the master; a centre crop would lose it
+    assert cropped.convert("L").getextrema()[1] > 150
+
+
+def _fake_provider(monkeypatch):
+    calls = []
+
+    def fake_text_to_image(client, prompt, tier, seed, negative_prompt=None):
+        calls.append((tier.width, tier.height))
+        return _key_art((tier.width, tier.height))
+
+    monkeypatch.setattr(poster_generator.settings, "image_provider", "huggingface")
+    monkeypatch.setattr(poster_generator, "_hf_client", lambda timeout=None: None)
+    monkeypatch.setattr(poster_generator, "_hf_text_to_image", fake_text_to_image)
+    return calls
+
+
+def _sizes(images):
+    sizes = []
+    for img in images:
+        png = base64.b64decode(img["image_url"].data_url().split(",", 1)[1])
+        sizes.append(Image.open(io.BytesIO(png)).size)
+    return sizes
+
+
+def test_master_campaign_uses_one_provider_call(monkeypatch):
+    calls = _fake_provider(monkeypatch)
+
+    images = poster_generator.generate_master_campaign("key art", ANALYSIS, seed=7)
+
+    # One master covering the widest and the tallest variant at native resolution
+    assert calls == [(1280, 1536)]
+    assert all(img["seed"] == 7 for img in images)
+    assert _sizes(images) == [spec["size"] for spec in poster_generator.VARIANTS]
+
+
+def test_draft_master_variants_are_not_upscaled(monkeypatch):
+    calls = _fake_provider(monkeypatch)
+
+    images = poster_generator.generate_master_campaign("key art", ANALYSIS, quality="draft", seed=7)
+
+    assert calls == [(640, 768)]
+    for (w, h), spec in zip(_sizes(images), poster_generator.VARIANTS):
+        spec_w, spec_h = spec["size"]
+        assert w <= spec_w and h <= spec_h
+        assert abs(w / h - spec_w / spec_h) < 0.01
@@ -0,0 +1,58 @@
+import logging
+
+from app import serve
+from app.memory import parse_smaps_rollup, process_memory
+
+# smaps_rollup of an app.serve worker: the classifier weights are shared with
+# the parent and the other worker, only the request-handling state is private
+WORKER_SMAPS_ROLLUP = """\
+5653b0be4000-7ffca7752000 ---p 00000000 00:00 0                          [rollup]
+Rss:              439296 kB
+Pss:              147712 kB
+Pss_Dirty:          9216 kB
+Pss_Anon:           9216 kB
+Pss_File:         138496 kB
+Pss_Shmem:             0 kB
+Shared_Clean:     421888 kB
+Shared_Dirty:       9400 kB
+Private_Clean:       512 kB
+Private_Dirty:      7496 kB
+Referenced:       439296 kB
+Anonymous:         16896 kB
+KSM:                   0 kB
+LazyFree:              0 kB
+AnonHugePages:         0 kB
+ShmemPmdMapped:        0 kB
+FilePmdMapped:         0 kB
+Shared_Hugetlb:        0 kB
+Private_Hugetlb:       0 kB
+Swap:                  0 kB
+SwapPss:               0 kB
+Locked:                0 kB
+"""
+
+
+def test_parse_smaps_rollup():
+    assert parse_smaps_rollup(WORKER_SMAPS_ROLLUP) == {
+        "rss": 439296 * 1024,
+        "pss": 147712 * 1024,
+        "shared": (421888 + 9400) * 1024,
+        "unique": (512 + 7496) * 1024,
+    }
+
+
+def test_process_memory_missing_pid():
+    assert process_memory(2**31 - 1) is None
+
+
+def test_serve_reports_unique_and_shared_per_worker(monkeypatch, caplog):
+    memory = parse_smaps_rollup(WORKER_SMAPS_ROLLUP)
+    monkeypatch.setattr(serve, "process_memory", lambda pid="self": memory)
+
+    with caplog.at_level(logging.INFO, logger="app.serve"):
+        serve._report_memory([101, 102])
+
+    workers = [r.getMessage() for r in caplog.records if r.getMessage().startswith("worker")]
+    assert len(workers) == 2
+    assert f"unique={serve._mb(memory['unique'])}" in workers[0]
+    assert f"shared={serve._mb(memory['shared'])}" in workers[0]
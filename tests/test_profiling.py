@@ -0,0 +1,82 @@
+import contextlib
+import os
+import time
+
+from app.config import settings
+from app.profiling import maybe_profile
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_profile_off_by_default():
+    assert isinstance(maybe_profile("test"), contextlib.nullcontext)
+
+
+def test_profile_header_needs_admin_token(monkeypatch):
+    monkeypatch.setattr(settings, "admin_token", None)
+    assert isinstance(maybe_profile("test", "1", "secret"), contextlib.nullcontext)
+    monkeypatch.setattr(settings, "admin_token", "secret")
+    assert isinstance(maybe_profile("test", "1"), contextlib.nullcontext)
+    assert isinstance(maybe_profile("test", "1", "wrong"), contextlib.nullcontext)
+
+
+def test_profile_writes_collapsed_stacks_and_summary(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "admin_token", "secret")
+
+    with maybe_profile("test", "1", "secret") as profiler:
+        _busy(0.1)
+
+    base = os.path.join(tmp_path, profiler.profile_id)
+    with open(base + ".collapsed") as f:
+        collapsed = f.read()
+    with open(base + ".txt") as f:
+        summary = f.read()
+    assert "_busy" in collapsed
+    assert "_busy" in summary
+
+
+def test_profile_covers_executor_threads_and_body(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.profiling import profiled
+
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "admin_token", "secret")
+
+    def body():
+        _busy(0.05)
+        yield b"{}"
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with maybe_profile("test", "1", "secret") as profiler:
+            pool.submit(profiled(_busy), 0.1).result()
+            chunks = profiler.stream(body())
+        # Nothing is written until the body has been sent
+        assert not os.path.exists(os.path.join(tmp_path, profiler.profile_id + ".collapsed"))
+        assert list(chunks) == [b"{}"]
+
+    with open(os.path.join(tmp_path, profiler.profile_id + ".collapsed")) as f:
+        roots = {line.split(";", 1)[0] for line in f}
+    assert {"provider", "stream"} <= roots
+
+
+def test_old_profiles_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "admin_token", "secret")
+    monkeypatch.setattr(settings, "profile_max_count", 2)
+
+    ids = []
+    for i in range(3):
+        with maybe_profile("test", "1", "secret") as profiler:
+            _busy(0.01)
+        ids.append(profiler.profile_id)
+        # Distinct mtimes, oldest first
+        for ext in (".collapsed", ".txt"):
+            os.utime(os.path.join(tmp_path, profiler.profile_id + ext), (i, i))
+
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{i}{ext}" for i in ids[1:] for ext in (".collapsed", ".txt"))
@@ -0,0 +1,108 @@
+import base64
+import json
+import os
+import tracemalloc
+
+from app.schemas import CampaignResponse, PosterVariant
+from app.streaming import EncodedImage, iter_json
+
+IMAGE_BYTES = 3 * 1024 * 1024
+NUM_VARIANTS = 3
+
+
+def _campaign(images):
+    return {
+        "campaign_id": "c0ffee",
+        "title": "Steel Reborn",
+        "tagline": "The war evolves.",
+        "genre": "Action",
+        "mood": "dynamic",
+        "color_palette": "oranges and blues",
+        "visual_style_keywords": ["epic scale", 'say "hi"'],
+        "model_version": "3f2a9c1b0d4e",
+        "seed": 7,
+        "variants": [
+            {"id": i, "variant": f"v{i}", "prompt": "p", "image_url": img, "quality": "final", "seed": 7}
+            for i, img in enumerate(images)
+        ],
+    }
+
+
+def _legacy_body(pngs):
+    """The previous path: data-URL strings, Pydantic validation, JSON string."""
+    images = [f"data:image/png;base64,{base64.b64encode(png).decode('utf-8')}" for png in pngs]
+    data = _campaign(images)
+    data["variants"] = [PosterVariant(**v) for v in data["variants"]]
+    return CampaignResponse(**data).model_dump_json().encode()
+
+
+def _peak(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_streamed_json_matches_legacy_response():
+    pngs = [os.urandom(100_000 + i) for i in range(NUM_VARIANTS)]
+    streamed = b"".join(iter_json(_campaign([EncodedImage(p) for p in pngs])))
+    assert json.loads(streamed) == json.loads(_legacy_body(pngs))
+
+
+def test_streaming_lowers_peak_memory():
+    pngs = [os.urandom(IMAGE_BYTES) for _ in range(NUM_VARIANTS)]
+
+    def stream():
+        for _ in iter_json(_campaign([EncodedImage(p) for p in pngs])):
+            pass
+
+    legacy_peak = _peak(lambda: _legacy_body(pngs))
+    streamed_peak = _peak(stream)
+    # Legacy holds several full-size copies per image; streaming holds one chunk
+    assert streamed_peak * 20 < legacy_peak
+
+
+def _campaign_peak(monkeypatch, num_images, budget_mb):
+    from PIL import Image
+
+    from app import poster_generator
+
+    def fake_text_to_image(client, prompt, tier, seed, negative_prompt=None):
+        # Noise does not compress: ~200 KB per PNG
+        return Image.frombytes("RGB", (256, 256), os.urandom(256 * 256 * 3))
+
+    monkeypatch.setattr(poster_generator.settings, "image_provider", "huggingface")
+    monkeypatch.setattr(poster_generator.settings, "image_memory_budget_mb", budget_mb)
+    monkeypatch.setattr(poster_generator, "_hf_client", lambda timeout=None: None)
+    monkeypatch.setattr(poster_generator, "_hf_text_to_image", fake_text_to_image)
+    prompts = [{"variant": "v", "prompt": "p", "quality": "draft"}]
+
+    def run():
+        images = poster_generator.generate_images_for_campaign(prompts, num_images_per_variant=num_images, seed=1)
+        body = _campaign([img["image_url"] for img in images])
+        for _ in iter_json(body):
+            pass
+        return images
+
+    images = []
+    peak = _peak(lambda: images.extend(run()))
+    return peak, images
+
+
+def test_memory_budget_keeps_peak_flat(monkeypatch):
+    # Warm up so one-off import allocations do not land in the first measurement
+    _campaign_peak(monkeypatch, 1, budget_mb=0.5)
+    small_peak, _ = _campaign_peak(monkeypatch, 4, budget_mb=0.5)
+    large_peak, images = _campaign_peak(monkeypatch, 16, budget_mb=0.5)
+    unbounded_peak, _ = _campaign_peak(monkeypatch, 16, budget_mb=0)
+
+    assert sum(img["image_url"].spilled for img in images) >= 12
+    # 4x the images with a budget: about the same peak; without one it grows
+    assert large_peak < small_peak * 1.3
+    assert large_peak * 2 < unbounded_peak
+
+    spilled = images[-1]["image_url"]
+    assert spilled.spilled
+    assert base64.b64decode(spilled.data_url().split(",", 1)[1])[:8] == b"\x89PNG\r\n\x1a\n"
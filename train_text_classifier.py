@@ -1,6 +1,7 @@
 import os
 os.environ["TRANSFORMERS_NO_TF"] = "1"
 
+import shutil
 from typing import Dict
 
 import numpy as np
@@ -36,6 +37,26 @@ def prepare_label_mapping(dataset) -> Dict[str, int]:
     return label2id, id2label
 
 
+def save_model_dir(model, tokenizer, output_dir: str):
+    """
+    Save into a fresh directory and swap it in with renames. Running servers
+    memory-map model.safetensors, so it must be replaced, never overwritten in
+    place; they pick up the new files through reload_classifier().
+    """
+    staging = f"{output_dir}.new"
+    shutil.rmtree(staging, ignore_errors=True)
+    model.save_pretrained(staging)
+    tokenizer.save_pretrained(staging)
+
+    retired = f"{output_dir}.old"
+    shutil.rmtree(retired, ignore_errors=True)
+    if os.path.isdir(output_dir):
+        os.rename(output_dir, retired)
+    os.rename(staging, output_dir)
+    # Unlinking keeps the old files alive for processes that still map them
+    shutil.rmtree(retired, ignore_errors=True)
+
+
 def main():
     
     if torch.cuda.is_available():
@@ -210,10 +231,8 @@ def main():
     )
 
     # save
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
     print(f"Saving model to {OUTPUT_DIR} ...")
-    model.save_pretrained(OUTPUT_DIR)
-    tokenizer.save_pretrained(OUTPUT_DIR)
+    save_model_dir(model, tokenizer, OUTPUT_DIR)
 
     print("Finished! You can now load the model from:", OUTPUT_DIR)
 